@@ -1,22 +1,29 @@
-import asyncio
 import logging
-from datetime import datetime
+import os
+from collections import Counter
+from datetime import date, datetime
+from typing import Optional, Literal
+from urllib.parse import quote
 from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import selectinload
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlalchemy import tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import select
+from starlette.background import BackgroundTask
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from bg import run_safe
 from config import settings
-from database import get_async_session_as_generator, get_next_serial_num
-from entities import ChatMessage, Report
-from google_drive import upload_excel_file_to_folder
-from models import ChatMessageCreateRequest, ChatMessageCreateResponse, MessageStatus, ReportResponse
-from processors import process_message
-from report import create_excel_report_file
-from pipelines.report_summary import summarize_reports
+from daily_reports import get_daily_report, get_daily_totals, stats as daily_report_stats
+from database import get_async_session_as_generator, allocate_serial_nums, pool_metrics
+from duplicates import content_hash, simhash
+from entities import ChatMessage, DailyReportTotal
+from jobs import notify_workers
+from llm_cache import stats as llm_cache_stats
+from models import ChatMessageCreateRequest, ChatMessageCreateResponse, MessageStatus
+from report_export import ReportFilter, export_reports_csv, export_reports_xlsx
+from uploads import upload_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +34,91 @@ router = APIRouter(
 tz = ZoneInfo("Europe/Moscow")
 
 
+def new_chat_message(request: ChatMessageCreateRequest) -> ChatMessage:
+    chat_message = ChatMessage(**request.model_dump())
+    chat_message.id = None
+    chat_message.status = MessageStatus.new
+    chat_message.created_at = request.created_at.astimezone(tz).replace(tzinfo=None)
+    chat_message.content_hash = content_hash(request.message_text)
+    chat_message.simhash = simhash(request.message_text)
+    chat_message.serial_num = 0
+    return chat_message
+
+
+async def find_message_ids(session: AsyncSession, keys: set[tuple[str, str]]) -> dict[tuple[str, str], int]:
+    rows = (await session.execute(
+        select(ChatMessage.id, ChatMessage.chat_id, ChatMessage.message_id)
+        .where(tuple_(ChatMessage.chat_id, ChatMessage.message_id).in_(list(keys)))
+    )).all()
+    return {(row.chat_id, row.message_id): row.id for row in rows}
+
+
+async def assign_serial_nums(session: AsyncSession, messages: list[tuple[int, str]]):
+    """
+    Нумерует вставленные сообщения (ID, user_id) в порядке списка. Номера выделяются только
+    фактически вставленным строкам, поэтому повторные доставки не оставляют пропусков в нумерации.
+    """
+    next_serials = await allocate_serial_nums(session, Counter(user_id for _, user_id in messages))
+    values = []
+    for chat_message_id, user_id in messages:
+        values.append({"id": chat_message_id, "serial_num": next_serials[user_id]})
+        next_serials[user_id] += 1
+    await session.execute(update(ChatMessage), values)
+
+
+async def ingest_messages(
+        session: AsyncSession,
+        requests: list[ChatMessageCreateRequest],
+) -> list[ChatMessageCreateResponse]:
+    """
+    Сохраняет сообщения одним многострочным INSERT ... ON CONFLICT DO NOTHING по (chat_id, message_id).
+    Повторная доставка того же сообщения Telegram (ретраи бота, повторная доставка после перезапуска)
+    возвращает ID уже сохраненного сообщения и не создает новую задачу обработки.
+    Ответ - ID сообщений в порядке запроса.
+    """
+    keys = [(request.chat_id, request.message_id) for request in requests]
+    existing = await find_message_ids(session, set(keys))
+    new_messages: dict[tuple[str, str], ChatMessage] = {}
+    for key, request in zip(keys, requests):
+        if key not in existing and key not in new_messages:
+            new_messages[key] = new_chat_message(request)
+
+    inserted: dict[tuple[str, str], int] = {}
+    if new_messages:
+        # Строки вставляются в одном порядке во всех транзакциях: одновременные пачки с общими
+        # сообщениями ждут друг друга на ON CONFLICT, но не блокируют друг друга взаимно
+        stmt = insert(ChatMessage).values([
+            new_messages[key].model_dump(exclude={"id"}) for key in sorted(new_messages)
+        ])
+        rows = (await session.execute(
+            stmt.on_conflict_do_nothing(index_elements=[ChatMessage.chat_id, ChatMessage.message_id])
+            .returning(ChatMessage.id, ChatMessage.chat_id, ChatMessage.message_id)
+        )).all()
+        inserted = {(row.chat_id, row.message_id): row.id for row in rows}
+        if len(inserted) < len(new_messages):
+            # То же сообщение одновременно сохранил другой запрос, ON CONFLICT дождался его коммита
+            existing |= await find_message_ids(session, set(new_messages) - set(inserted))
+        if inserted:
+            if settings.google_drive_folder_dumped:
+                await assign_serial_nums(session, [
+                    (inserted[key], chat_message.user_id)
+                    for key, chat_message in new_messages.items()
+                    if key in inserted
+                ])
+            await notify_workers(session)
+    await session.commit()
+
+    responses = []
+    for key in keys:
+        if key in inserted:
+            responses.append(ChatMessageCreateResponse(id=inserted.pop(key)))
+        else:
+            chat_message_id = existing.get(key) or responses[keys.index(key)].id
+            logger.info(f"Message {key} is already stored with id {chat_message_id}, skipped")
+            responses.append(ChatMessageCreateResponse(id=chat_message_id, duplicate=True))
+    return responses
+
+
 @router.post("/messages")
 async def create_message(
         request: ChatMessageCreateRequest,
@@ -34,22 +126,32 @@ async def create_message(
 ):
     try:
         logger.info(f"Received message: {request.message_text}")
-        chat_message = ChatMessage(**request.model_dump())
-        chat_message.id = None
-        chat_message.status = MessageStatus.new
-        chat_message.created_at = request.created_at.astimezone(tz).replace(tzinfo=None)
-        if settings.google_drive_folder_dumped:
-            next_serial = await get_next_serial_num(session, request.user_id)
-            chat_message.serial_num = next_serial
-        else:
-            chat_message.serial_num = 0
-        session.add(chat_message)
-        await session.commit()
-        await session.refresh(chat_message)
-        asyncio.create_task(run_safe(process_message, chat_message.id))
-        return ChatMessageCreateResponse(
-            id=chat_message.id,
+        return (await ingest_messages(session, [request]))[0]
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.post("/messages:batch")
+async def create_messages(
+        requests: list[ChatMessageCreateRequest],
+        session: AsyncSession = Depends(get_async_session_as_generator),
+) -> list[ChatMessageCreateResponse]:
+    """
+    Сохраняет пачку сообщений (например, накопившихся у бота за время простоя) в одной транзакции:
+    номера выделяются одним запросом на всех пользователей, сообщения вставляются одним многострочным INSERT.
+    """
+    if len(requests) > settings.message_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is too large: {len(requests)} > {settings.message_batch_max_size}",
         )
+    if not requests:
+        return []
+    try:
+        logger.info(f"Received batch of {len(requests)} messages")
+        return await ingest_messages(session, requests)
     except Exception as e:
         await session.rollback()
         logger.error(f"Error: {e}", exc_info=True)
@@ -57,26 +159,57 @@ async def create_message(
 
 
 @router.post("/reports")
-async def create_report(session: AsyncSession = Depends(get_async_session_as_generator)):
-    report_at = datetime.now(tz)
-    reports: list[Report] = (await session.exec(
-        select(Report)
-        .options(
-            selectinload(Report.department),
-            selectinload(Report.operation),
-            selectinload(Report.crop)
+async def create_report():
+    return await get_daily_report(datetime.now(tz))
+
+
+@router.get("/reports/totals")
+async def get_report_totals(
+        report_on: Optional[date] = None,
+        session: AsyncSession = Depends(get_async_session_as_generator),
+) -> list[DailyReportTotal]:
+    return await get_daily_totals(session, report_on or datetime.now(tz).date())
+
+
+@router.get("/reports/export")
+async def export_reports(
+        date_from: date,
+        date_to: Optional[date] = None,
+        department_id: Optional[int] = None,
+        operation_id: Optional[int] = None,
+        crop_id: Optional[int] = None,
+        format: Literal["xlsx", "csv"] = "xlsx",
+):
+    report_filter = ReportFilter(
+        date_from=date_from,
+        date_to=date_to or date_from,
+        department_id=department_id,
+        operation_id=operation_id,
+        crop_id=crop_id,
+    )
+    if report_filter.date_to < report_filter.date_from:
+        raise HTTPException(status_code=400, detail="date_to must not be earlier than date_from")
+    filename = f"Отчеты за {report_filter.period}.{format}"
+    if format == "csv":
+        return StreamingResponse(
+            export_reports_csv(report_filter),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
         )
-        .where(Report.worked_on == report_at.date())
-    )).all()
-    file_path = create_excel_report_file(report_at, reports)
-    _, file_url = upload_excel_file_to_folder(file_path)
-    
-    # Используем summarize_reports для анализа отчетов
-    logger.info(f"Запуск анализа {len(reports)} отчетов")
-    summary = await summarize_reports(reports)
-    
-    return ReportResponse(
-        created_at=report_at,
-        url=file_url,
-        summary=summary
+    path = await export_reports_xlsx(report_filter)
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=filename,
+        background=BackgroundTask(os.remove, path),
     )
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return {
+        "db_pool": pool_metrics(),
+        "uploads": upload_metrics(),
+        "llm_cache": dict(llm_cache_stats),
+        "daily_reports": dict(daily_report_stats),
+    }
@@ -0,0 +1,13 @@
+from config import settings
+from database import load_csv_as_dicts
+from dictionaries import DictionarySnapshot
+from entities import Department, Operation, Crop
+
+
+def load_dictionaries() -> DictionarySnapshot:
+    """Снимок справочников из CSV без обращения к БД (ID присваиваются по порядку строк)"""
+    def load(entity, name):
+        rows = load_csv_as_dicts(f"{settings.dicts_path}/{name}.csv")
+        return [entity(id=i, **row) for i, row in enumerate(rows, start=1)]
+
+    return DictionarySnapshot.build(0, load(Department, "departments"), load(Operation, "operations"), load(Crop, "crops"))
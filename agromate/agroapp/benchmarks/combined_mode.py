@@ -0,0 +1,78 @@
+"""
+Сравнение двухэтапного пайплайна (classify_message + solve_reports)
+с объединенным (analyze_message) по времени, токенам и точности классификации.
+
+Запуск из каталога agroapp:
+    python -m benchmarks.combined_mode messages.csv
+
+CSV должен содержать колонки message_text и is_report (1 - отчет, 0 - нет).
+"""
+import argparse
+import asyncio
+import csv
+import statistics
+import time
+from datetime import datetime
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+from benchmarks import load_dictionaries
+from config import settings
+from models import MessageType
+from pipelines.message_analysis import analyze_message
+from pipelines.message_definition import classify_message, model as classification_model
+from pipelines.report_solution import solve_reports
+
+
+async def run_two_stage(text: str, dictionaries) -> tuple[MessageType, list]:
+    classification = await classify_message(text, classification_model)
+    if classification.message_type != "field_report":
+        return MessageType.spam, []
+    return MessageType.report, await solve_reports(0, text, datetime.now(), dictionaries)
+
+
+async def run_combined(text: str, dictionaries) -> tuple[MessageType, list]:
+    return await analyze_message(0, text, datetime.now(), dictionaries)
+
+
+async def measure(name: str, pipeline, messages: list[tuple[str, bool]], dictionaries):
+    latencies = []
+    correct = 0
+    entries = 0
+    with get_usage_metadata_callback() as callback:
+        for text, is_report in messages:
+            start = time.perf_counter()
+            message_type, reports = await pipeline(text, dictionaries)
+            latencies.append(time.perf_counter() - start)
+            correct += (message_type == MessageType.report) == is_report
+            entries += len(reports)
+    usage = callback.usage_metadata.values()
+    input_tokens = sum(u.get("input_tokens", 0) for u in usage)
+    output_tokens = sum(u.get("output_tokens", 0) for u in usage)
+    print(
+        f"{name:<10} | accuracy {correct / len(messages):6.2%} | entries {entries:5d} | "
+        f"latency avg {statistics.mean(latencies):6.2f}s p95 {sorted(latencies)[int(len(latencies) * 0.95)]:6.2f}s | "
+        f"tokens in {input_tokens:8d} out {output_tokens:7d}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", help="CSV с колонками message_text и is_report")
+    parser.add_argument("--limit", type=int, default=None, help="Ограничить число сообщений")
+    args = parser.parse_args()
+
+    with open(args.dataset, newline="", encoding="utf-8") as f:
+        messages = [(row["message_text"], row["is_report"].strip() in ("1", "true", "True")) for row in csv.DictReader(f)]
+    messages = messages[:args.limit]
+    dictionaries = load_dictionaries()
+    # Замеряются запросы к модели, а не попадания в кэш ответов от прошлых запусков
+    settings.llm_cache_enabled = False
+
+    print(f"Сообщений: {len(messages)}, режим разбора: {settings.mode}")
+    await measure("two-stage", run_two_stage, messages, dictionaries)
+    await measure("combined", run_combined, messages, dictionaries)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+"""
+Время частых запросов приложения к БД без индексов миграций 0002/0003 и с ними.
+
+Работает с базой из DB_URL (схема должна быть накачена миграциями). Лучше запускать
+на отдельной базе: заполнение добавляет миллион сообщений, а замер "без индексов"
+удаляет индексы внутри транзакции, которая затем откатывается. Изменяющие запросы
+(выбор задач, выделение номеров) выполняются в точке сохранения и тоже откатываются.
+Каждое заполнение пишет сообщения в свой чат и от своих пользователей, поэтому его
+можно повторять на той же базе.
+
+Запуск из каталога agroapp:
+    python -m benchmarks.db_indexes --seed 1000000
+    python -m benchmarks.db_indexes              # только замер на уже заполненной базе
+    python -m benchmarks.db_indexes --cleanup    # удалить сгенерированные данные
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database import async_engine
+
+SEED_USERNAME = "benchmark"
+USERS = 200
+DAYS = 365
+
+# Индексы миграций 0002 (content_hash) и 0003
+INDEXES = [
+    "ix_chat_message_content_hash",
+    "ix_report_worked_on",
+    "ix_report_chat_message_id",
+    "ix_chat_message_user_id_serial_num",
+    "ix_chat_message_created_at",
+    "ix_chat_message_pending",
+]
+
+# Запросы повторяют выполняемые приложением; параметры берутся из последнего сгенерированного сообщения
+QUERIES = {
+    "reports for a day (/api/reports)": (
+        "SELECT * FROM report WHERE worked_on = :worked_on"
+    ),
+    "daily report version (get_daily_report)": (
+        "SELECT COALESCE(MAX(id), 0), count(*) FROM report WHERE worked_on = :worked_on"
+    ),
+    "reports of a message": (
+        "SELECT * FROM report WHERE chat_message_id = :id"
+    ),
+    # jobs.claim_jobs
+    "claim jobs (claim_jobs)": (
+        "UPDATE chat_message SET locked_until = now() + interval '600 seconds', locked_by = 'benchmark', "
+        "attempts = attempts + 1 "
+        "WHERE id IN ("
+        "SELECT id FROM chat_message WHERE status IN ('new', 'processing') "
+        "AND (available_at IS NULL OR available_at <= now()) AND (locked_until IS NULL OR locked_until < now()) "
+        "ORDER BY id LIMIT 20 FOR UPDATE SKIP LOCKED"
+        ") RETURNING id, status"
+    ),
+    # duplicates.find_exact_duplicate
+    "exact duplicate (find_exact_duplicate)": (
+        "SELECT id FROM chat_message WHERE id < :id "
+        "AND created_at >= CAST(:created_at AS timestamp) - interval '72 hours' "
+        "AND status != 'failed' AND duplicate_of_id IS NULL AND content_hash = :content_hash "
+        "AND chat_id = :chat_id AND user_id = :user_id "
+        "AND created_at >= date_trunc('day', CAST(:created_at AS timestamp)) "
+        "AND created_at < date_trunc('day', CAST(:created_at AS timestamp)) + interval '1 day' "
+        "ORDER BY id DESC LIMIT 1"
+    ),
+    # database.allocate_serial_nums
+    "allocate serial_num (allocate_serial_nums)": (
+        "INSERT INTO user_serial_counter (user_id, last_serial) VALUES (:user_id, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET last_serial = user_serial_counter.last_serial + excluded.last_serial "
+        "RETURNING user_id, last_serial"
+    ),
+}
+
+
+async def seed(conn: AsyncConnection, messages: int):
+    # Чат и пользователи свои у каждого заполнения: message_id не пересекаются с прошлыми запусками
+    # (uq_chat_message_chat_id_message_id), а счетчики номеров начинаются с нуля
+    run = uuid.uuid4().hex[:8]
+    print(f"Seeding {messages} messages (run {run})...")
+    await conn.execute(text(f"""
+        INSERT INTO chat_message (
+            serial_num, username, user_id, chat_id, message_id, created_at, message_text, content_hash,
+            status, attempts
+        )
+        SELECT
+            g / {USERS} + 1,
+            '{SEED_USERNAME}',
+            'benchmark-{run}-' || (g % {USERS}),
+            'benchmark-{run}',
+            g::text,
+            now() - make_interval(secs => random() * {DAYS} * 86400),
+            text,
+            encode(sha256(convert_to(text, 'UTF8')), 'hex'),
+            -- почти все сообщения уже обработаны, в очереди единицы
+            (CASE WHEN g % 10000 = 0 THEN 'new' WHEN g % 3 = 0 THEN 'spam' ELSE 'processed' END)::messagestatus,
+            1
+        FROM generate_series(1, :messages) AS g,
+             LATERAL (SELECT 'пахота пу ' || (g % 30) || ' ' || (g % 500) || '/' || (g % 4000) AS text) AS t
+    """), {"messages": messages})
+    await conn.execute(text(f"""
+        INSERT INTO user_serial_counter (user_id, last_serial)
+        SELECT user_id, MAX(serial_num) FROM chat_message WHERE chat_id = 'benchmark-{run}' GROUP BY user_id
+    """))
+    await conn.execute(text(f"""
+        INSERT INTO report (worked_on, chat_message_id, day_area, cumulative_area, note)
+        SELECT created_at::date, id, (id % 500)::float, (id % 4000)::float,
+               CASE WHEN id % 20 = 0 THEN 'Не найдена культура' END
+        FROM chat_message
+        WHERE username = '{SEED_USERNAME}' AND status = 'processed'
+    """))
+    await conn.execute(text("ANALYZE chat_message"))
+    await conn.execute(text("ANALYZE report"))
+    await conn.execute(text("ANALYZE user_serial_counter"))
+
+
+async def cleanup(conn: AsyncConnection):
+    # Ссылки duplicate_of_id/near_duplicate_of_id не проиндексированы, и без временных индексов проверка внешних
+    # ключей просматривает всю таблицу на каждое удаляемое сообщение. Индексы удаляются в той же транзакции
+    for column in ("duplicate_of_id", "near_duplicate_of_id"):
+        await conn.execute(text(f"CREATE INDEX benchmark_cleanup_{column} ON chat_message ({column})"))
+    await conn.execute(text(f"""
+        DELETE FROM report WHERE chat_message_id IN (SELECT id FROM chat_message WHERE username = '{SEED_USERNAME}')
+    """))
+    await conn.execute(text(f"DELETE FROM chat_message WHERE username = '{SEED_USERNAME}'"))
+    await conn.execute(text("DELETE FROM user_serial_counter WHERE user_id LIKE 'benchmark-%'"))
+    for column in ("duplicate_of_id", "near_duplicate_of_id"):
+        await conn.execute(text(f"DROP INDEX benchmark_cleanup_{column}"))
+
+
+async def query_params(conn: AsyncConnection) -> dict:
+    """Параметры запросов: последнее сгенерированное сообщение, его пользователь и день"""
+    row = (await conn.execute(text(f"""
+        SELECT id, chat_id, user_id, content_hash, created_at, created_at::date - 10 AS worked_on
+        FROM chat_message WHERE username = '{SEED_USERNAME}' ORDER BY id DESC LIMIT 1
+    """))).one_or_none()
+    if row is None:
+        raise SystemExit("No benchmark data, run with --seed first")
+    return dict(row._mapping)
+
+
+async def measure(conn: AsyncConnection, repeats: int, params: dict) -> dict[str, float]:
+    timings = {}
+    for name, query in QUERIES.items():
+        samples = []
+        for _ in range(repeats):
+            # EXPLAIN ANALYZE выполняет запрос: изменения откатываются, чтобы повторы видели одни и те же данные
+            savepoint = await conn.begin_nested()
+            statement = text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+            bound = {key: value for key, value in params.items() if f":{key}" in query}
+            plan = (await conn.execute(statement, bound)).scalar_one()
+            await savepoint.rollback()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            samples.append(plan[0]["Execution Time"])
+        timings[name] = statistics.median(samples)
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="Сколько сообщений сгенерировать перед замером")
+    parser.add_argument("--repeats", type=int, default=5, help="Повторов каждого запроса (берется медиана)")
+    parser.add_argument("--cleanup", action="store_true", help="Удалить сгенерированные данные и выйти")
+    args = parser.parse_args()
+
+    async with async_engine.connect() as conn:
+        if args.cleanup:
+            await cleanup(conn)
+            await conn.commit()
+            return
+        if args.seed:
+            await seed(conn, args.seed)
+            await conn.commit()
+        params = await query_params(conn)
+        await conn.rollback()
+
+        # Без индексов: удаляются в транзакции, которая откатывается после замера
+        for index in INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        before = await measure(conn, args.repeats, params)
+        await conn.rollback()
+
+        after = await measure(conn, args.repeats, params)
+        await conn.rollback()
+
+    print(f"{'query':<42} | {'no indexes':>12} | {'indexes':>10} | speedup")
+    for name in QUERIES:
+        print(f"{name:<42} | {before[name]:10.2f}ms | {after[name]:8.2f}ms | {before[name] / max(after[name], 1e-3):6.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Проверка идемпотентности приема сообщений: одни и те же сообщения Telegram доставляются
+многократно и одновременно (по одному и пачками), как при ретраях бота и повторной
+доставке обновлений после перезапуска.
+
+Ожидается, что каждое (chat_id, message_id) сохранено ровно один раз: все ответы
+для него содержат один и тот же ID, и только один из них без пометки duplicate.
+
+Запуск из каталога agroapp при запущенном приложении:
+    python -m benchmarks.delivery_storm http://localhost:8080 --messages 50 --repeats 20
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import aiohttp
+
+from models import ChatMessageCreateRequest, ChatMessageCreateResponse
+
+
+def make_messages(count: int) -> list[ChatMessageCreateRequest]:
+    # Уникальный чат, чтобы повторный запуск не смешивался с прошлыми данными
+    chat_id = f"storm-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    return [
+        ChatMessageCreateRequest(
+            username="storm",
+            user_id=f"storm-user-{i % 5}",
+            chat_id=chat_id,
+            message_id=str(i),
+            message_text=f"Пахота ПУ {i % 30} {i}/{i * 10}",
+            created_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+async def send_one(session: aiohttp.ClientSession, url: str, message: ChatMessageCreateRequest):
+    async with session.post(
+            f"{url}/api/messages",
+            data=message.model_dump_json(),
+            headers={"Content-Type": "application/json"},
+    ) as response:
+        response.raise_for_status()
+        return [(message, ChatMessageCreateResponse(**await response.json()))]
+
+
+async def send_batch(session: aiohttp.ClientSession, url: str, messages: list[ChatMessageCreateRequest]):
+    async with session.post(
+            f"{url}/api/messages:batch",
+            data="[" + ",".join(m.model_dump_json() for m in messages) + "]",
+            headers={"Content-Type": "application/json"},
+    ) as response:
+        response.raise_for_status()
+        return list(zip(messages, [ChatMessageCreateResponse(**item) for item in await response.json()]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="Адрес приложения, например http://localhost:8080")
+    parser.add_argument("--messages", type=int, default=50, help="Уникальных сообщений")
+    parser.add_argument("--repeats", type=int, default=20, help="Доставок каждого сообщения")
+    parser.add_argument("--batch-size", type=int, default=10, help="Размер пачки для /api/messages:batch")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    deliveries = messages * args.repeats
+    random.shuffle(deliveries)
+
+    requests = []
+    async with aiohttp.ClientSession() as session:
+        i = 0
+        while i < len(deliveries):
+            # Доставки вперемешку: одиночные запросы и пачки, в пачке возможны повторы
+            if random.random() < 0.5:
+                requests.append(send_one(session, args.url, deliveries[i]))
+                i += 1
+            else:
+                requests.append(send_batch(session, args.url, deliveries[i:i + args.batch_size]))
+                i += args.batch_size
+        start = time.perf_counter()
+        results = await asyncio.gather(*requests)
+        elapsed = time.perf_counter() - start
+
+    ids = defaultdict(set)
+    created = defaultdict(int)
+    for message, response in (pair for result in results for pair in result):
+        key = (message.chat_id, message.message_id)
+        ids[key].add(response.id)
+        created[key] += not response.duplicate
+
+    conflicting = {key: value for key, value in ids.items() if len(value) != 1}
+    wrong_created = {key: count for key, count in created.items() if count != 1}
+    print(
+        f"Deliveries: {len(deliveries)} in {len(requests)} requests, {elapsed:.2f}s; "
+        f"unique messages: {len(messages)}, stored: {len({i for value in ids.values() for i in value})}"
+    )
+    if conflicting or wrong_created:
+        print(f"FAILED: different ids {conflicting}, created not once {wrong_created}")
+        raise SystemExit(1)
+    print("OK: every message stored exactly once")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
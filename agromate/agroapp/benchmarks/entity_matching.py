@@ -0,0 +1,88 @@
+"""
+Сравнение сопоставления ответов LLM со справочниками: линейный перебор
+(прежние _match_*_id) против хеш-индексов снимка справочников.
+
+Запуск из каталога agroapp:
+    python -m benchmarks.entity_matching --entries 40
+"""
+import argparse
+import random
+import timeit
+
+from benchmarks import load_dictionaries
+from entities import Department, Operation, Crop
+
+
+def linear_match_department_id(name: str, departments: list[Department]) -> int:
+    for d in departments:
+        if (d.department_number == name or
+            d.subdivision == name or
+            d.production_unit == name or
+            (d.aliases and name in d.aliases.split(","))):
+            return d.id
+    raise ValueError(f"Не найдено подразделение: {name}")
+
+
+def linear_match_operation_id(name: str, operations: list[Operation]) -> int:
+    for o in operations:
+        if o.operation_name == name:
+            return o.id
+    raise ValueError(f"Не найдена операция: {name}")
+
+
+def linear_match_crop_id(name: str, crops: list[Crop]) -> int:
+    for c in crops:
+        if c.crop_name == name:
+            return c.id
+    raise ValueError(f"Не найдена культура: {name}")
+
+
+def try_match(match, *args):
+    try:
+        return match(*args)
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=40, help="Записей в одном сообщении")
+    parser.add_argument("--repeat", type=int, default=2000, help="Повторов разбора сообщения")
+    args = parser.parse_args()
+
+    dictionaries = load_dictionaries()
+    random.seed(0)
+    # Ответ LLM: значения из Literal-типов схемы, изредка - значения не из справочника
+    entries = [
+        (
+            random.choice(dictionaries.department_names + ("Неизвестное",)),
+            random.choice(dictionaries.operation_names),
+            random.choice(dictionaries.crop_names),
+        )
+        for _ in range(args.entries)
+    ]
+
+    def linear():
+        for department, operation, crop in entries:
+            try_match(linear_match_department_id, department, dictionaries.departments)
+            try_match(linear_match_operation_id, operation, dictionaries.operations)
+            try_match(linear_match_crop_id, crop, dictionaries.crops)
+
+    def indexed():
+        for department, operation, crop in entries:
+            try_match(dictionaries.department_index.match, department)
+            try_match(dictionaries.operation_index.match, operation)
+            try_match(dictionaries.crop_index.match, crop)
+
+    print(
+        f"Справочники: {len(dictionaries.departments)} подразделений, "
+        f"{len(dictionaries.operations)} операций, {len(dictionaries.crops)} культур; "
+        f"записей в сообщении: {args.entries}"
+    )
+    for name, fn in (("linear", linear), ("indexed", indexed)):
+        seconds = min(timeit.repeat(fn, number=args.repeat, repeat=5))
+        print(f"{name:<8} | {seconds / args.repeat * 1e6:8.1f} мкс на сообщение")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Сравнение построения Excel-отчета: прежнее копирование шести объектов стиля
+на каждую ячейку, копирование индекса стиля и потоковая запись (write-only).
+
+Запуск из каталога agroapp:
+    python -m benchmarks.excel_report --rows 10000 100000 [--memory]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from copy import copy
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from openpyxl import load_workbook
+from openpyxl.comments import Comment
+
+from benchmarks import load_dictionaries
+from config import settings
+from report import (
+    TEMPLATE_ROW_IDX,
+    YELLOW_FILL,
+    create_excel_report,
+    create_excel_from_template,
+    write_excel_report,
+    report_row_values,
+)
+
+
+def legacy_excel_report(report_on, reports, file_path):
+    wb = create_excel_from_template(report_on)
+    ws = wb.active
+    for i, report in enumerate(reports):
+        row_idx = TEMPLATE_ROW_IDX + i
+        for col_idx, value in enumerate(report_row_values(report), start=1):
+            tmp = ws.cell(row=TEMPLATE_ROW_IDX, column=col_idx)
+            dst = ws.cell(row=row_idx, column=col_idx, value=value)
+            dst.font = copy(tmp.font)
+            dst.border = copy(tmp.border)
+            dst.fill = copy(tmp.fill)
+            dst.protection = copy(tmp.protection)
+            dst.alignment = copy(tmp.alignment)
+            dst.number_format = copy(tmp.number_format)
+            if col_idx in (2, 3, 4):
+                if (
+                        (col_idx == 2 and not report.department) or
+                        (col_idx == 3 and not report.operation) or
+                        (col_idx == 4 and not report.crop)
+                ):
+                    dst.fill = YELLOW_FILL
+                    if report.note:
+                        dst.comment = Comment(report.note, settings.bot_name)
+    wb.save(file_path)
+
+
+def style_index_excel_report(report_on, reports, file_path):
+    wb, _ = create_excel_report(report_on, reports)
+    wb.save(file_path)
+
+
+def generate_reports(count: int) -> list:
+    dictionaries = load_dictionaries()
+    random.seed(0)
+    reports = []
+    for _ in range(count):
+        unresolved = random.random() < 0.1
+        reports.append(SimpleNamespace(
+            worked_on=date(2025, 6, 1),
+            department=None if unresolved else random.choice(dictionaries.departments),
+            operation=random.choice(dictionaries.operations),
+            crop=random.choice(dictionaries.crops),
+            department_raw="Отд 99" if unresolved else None,
+            operation_raw=None,
+            crop_raw=None,
+            department_predicted=None,
+            operation_predicted=None,
+            crop_predicted=None,
+            note="Подразделение: не найдено в справочнике" if unresolved else None,
+            day_area=round(random.uniform(1, 200), 2),
+            cumulative_area=round(random.uniform(200, 2000), 2),
+            day_yield=None,
+            cumulative_yield=None,
+        ))
+    return reports
+
+
+def snapshot(file_path: str) -> list:
+    ws = load_workbook(file_path).active
+    rows = [ws.title]
+    for row in ws.iter_rows():
+        rows.append([
+            (cell.value, cell.number_format, cell.fill.fgColor.rgb, cell.font.b, cell.comment.text if cell.comment else None)
+            for cell in row
+        ])
+    return rows
+
+
+def measure(name: str, build, reports: list, file_path: str, trace_memory: bool):
+    # tracemalloc заметно замедляет openpyxl, поэтому память меряется только по запросу
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    build(datetime(2025, 6, 1), reports, file_path)
+    elapsed = time.perf_counter() - start
+    memory = ""
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory = f" | пик памяти {peak / 2 ** 20:7.1f} МБ"
+    print(
+        f"{name:<12} | {len(reports):7d} строк | {elapsed:7.2f} с | "
+        f"файл {os.path.getsize(file_path) / 2 ** 20:5.1f} МБ{memory}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="Размеры отчетов")
+    parser.add_argument("--memory", action="store_true", help="Измерять пик памяти (tracemalloc)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.gettempdir()
+    builders = (
+        ("legacy", legacy_excel_report),
+        ("style-index", style_index_excel_report),
+        ("write-only", write_excel_report),
+    )
+
+    # Содержимое и оформление ячеек должны совпадать у всех вариантов
+    reports = generate_reports(200)
+    for name, build in builders:
+        build(datetime(2025, 6, 1), reports, os.path.join(tmp_dir, f"bench-{name}.xlsx"))
+    expected = snapshot(os.path.join(tmp_dir, "bench-legacy.xlsx"))
+    for name, _ in builders[1:]:
+        actual = snapshot(os.path.join(tmp_dir, f"bench-{name}.xlsx"))
+        # В шаблоне есть пустые оформленные строки, write-only их не пишет
+        assert actual == expected[:len(actual)], f"{name}: результат отличается от прежнего"
+
+    for count in args.rows:
+        reports = generate_reports(count)
+        for name, build in builders:
+            measure(name, build, reports, os.path.join(tmp_dir, f"bench-{name}.xlsx"), args.memory)
+
+
+if __name__ == "__main__":
+    main()
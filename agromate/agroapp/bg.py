@@ -1,8 +1,10 @@
 import asyncio
 import logging
 
+from config import settings
+
 logger = logging.getLogger(__name__)
-semaphore = asyncio.Semaphore(20)
+semaphore = asyncio.Semaphore(settings.job_concurrency)
 
 
 async def run_safe(task_fn, *args, **kwargs):
@@ -1,25 +1,74 @@
+import asyncio
+import logging
+from typing import Optional
+
 import aiohttp
+from pydantic import BaseModel
 
 from config import settings
 from models import ChatMessageReactionRequest, ChatMessageReplyRequest
 
+logger = logging.getLogger(__name__)
+
+# Ответы бота, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """
+    Общая сессия к API бота: соединения переиспользуются (keep-alive), поэтому реакции
+    и ответы на множество сообщений не открывают новое TCP-соединение на каждый запрос.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.bot_client_max_connections),
+            timeout=aiohttp.ClientTimeout(total=settings.bot_client_timeout_seconds),
+            headers={"Content-Type": "application/json"},
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def _post(path: str, payload: BaseModel, idempotent: bool):
+    """
+    Повторяет запрос с экспоненциальной задержкой. Неидемпотентные запросы (ответ в чат)
+    повторяются, только если соединение не удалось установить и запрос точно не был отправлен.
+    """
+    session = await open_session()
+    for attempt in range(1, settings.bot_client_max_attempts + 1):
+        last_attempt = attempt >= settings.bot_client_max_attempts
+        try:
+            async with session.post(f'{settings.bot_url}{path}', data=payload.model_dump_json()) as response:
+                if response.status == 200:
+                    return
+                error = Exception(f"Error: {response.status} {await response.text()}")
+                if last_attempt or not idempotent or response.status not in RETRYABLE_STATUSES:
+                    raise error
+        except aiohttp.ClientConnectorError as e:
+            if last_attempt:
+                raise
+            error = e
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if last_attempt or not idempotent:
+                raise
+            error = e
+        delay = settings.bot_client_retry_backoff_seconds * 2 ** (attempt - 1)
+        logger.warning(f"Request {path} failed (attempt {attempt}), retry in {delay}s: {error}")
+        await asyncio.sleep(delay)
+
 
 async def reply_on_message(payload: ChatMessageReplyRequest):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-                f'{settings.bot_url}/api/replies',
-                headers={"Content-Type": "application/json"},
-                data=payload.model_dump_json(),
-        ) as response:
-            if response.status != 200:
-                raise Exception(f"Error: {response.status} {await response.text()}")
+    await _post('/api/replies', payload, idempotent=False)
+
 
 async def send_reactions(payload: ChatMessageReactionRequest):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-                f'{settings.bot_url}/api/reactions',
-                headers={"Content-Type": "application/json"},
-                data=payload.model_dump_json(),
-        ) as response:
-            if response.status != 200:
-                raise Exception(f"Error: {response.status} {await response.text()}")
+    await _post('/api/reactions', payload, idempotent=True)
@@ -1,6 +1,9 @@
+import socket
 from os import getenv
+from typing import Optional
 
 from dotenv import load_dotenv
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 load_dotenv(getenv("ENV_FILE", ".env"))
@@ -9,19 +12,77 @@ load_dotenv(getenv("ENV_FILE", ".env"))
 class Settings(BaseSettings):
     debug: bool
     db_url: str
+    # Пул соединений: по соединению на задачу воркера (job_concurrency), LISTEN и выбор задач,
+    # выгрузка отчетов и обработчики фоновых загрузок (upload_workers), запросы API (см. database.required_connections)
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Кэш подготовленных выражений asyncpg; 0 - для PgBouncer в режиме transaction
+    db_statement_cache_size: int = 100
     bot_url: str
     bot_reply_on_failed: bool = False
+    # HTTP-клиент к боту: одна сессия на процесс с keep-alive соединениями
+    bot_client_max_connections: int = 10
+    bot_client_timeout_seconds: float = 15.0
+    bot_client_max_attempts: int = 3
+    bot_client_retry_backoff_seconds: float = 0.5
     llm_api_base_url: str
     llm_api_key: str
     configs_path: str
     dicts_path: str
     report_template_path: str
-    google_credentials_path: str
-    google_drive_folder_url: str
+    google_credentials_path: Optional[str] = None
+    google_drive_folder_url: Optional[str] = None
     google_drive_folder_dumped: bool
+    # Хранилище отчетов и выгрузок: drive, local или s3
+    storage_backend: str = "drive"
+    storage_local_path: str = "artifacts"
+    storage_public_url: Optional[str] = None
+    s3_endpoint_url: Optional[str] = None
+    s3_bucket: Optional[str] = None
+    s3_access_key: Optional[str] = None
+    s3_secret_key: Optional[str] = None
+    s3_region: Optional[str] = None
+    s3_url_expires_seconds: int = 7 * 24 * 3600
     team_name: str
     mode: str
     bot_name: str = "AgroMate"
+    prefilter_enabled: bool = True
+    dictionary_refresh_seconds: float = 30.0
+    entity_match_threshold: float = 0.8
+    duplicate_window_hours: int = 72
+    near_duplicate_distance: int = 4
+    llm_cache_enabled: bool = True
+    llm_cache_ttl_hours: int = 168
+    llm_cache_max_entries: int = 10000
+    report_dump_debounce_seconds: float = 30.0
+    upload_workers: int = 4
+    # Фоновых загрузок в очереди; сверх этого новые отбрасываются
+    upload_queue_size: int = 100
+    upload_max_attempts: int = 4
+    upload_retry_backoff_seconds: float = 1.0
+    # Максимум сообщений в одном запросе POST /api/messages:batch
+    message_batch_max_size: int = 500
+    # Выгрузка отчетов за период: строк на одну порцию серверного курсора
+    export_batch_size: int = 1000
+    job_worker_enabled: bool = True
+    job_concurrency: int = 20
+    job_poll_interval: float = 2.0
+    # Аренда задачи: сообщения прерванной обработки снова выбираются воркерами после ее истечения.
+    # Свои аренды процесс снимает сам при остановке и после перезапуска (если worker_id не изменился)
+    job_lease_seconds: int = 600
+    # Идентификатор процесса-воркера в аренде задач: должен быть уникальным среди одновременно
+    # работающих процессов и постоянным между их перезапусками
+    worker_id: str = Field(default_factory=socket.gethostname)
+    job_max_attempts: int = 5
+    # Аренда сборки отчета за день (файл, загрузка и сводка LLM) и интервал, с которым ее ждут другие запросы.
+    # Аренда прерванной сборки освобождается по истечении срока
+    daily_report_lease_seconds: int = 300
+    daily_report_poll_interval: float = 1.0
+    job_retry_backoff_seconds: int = 10
 
 
 settings = Settings()
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import update, delete, func, text, case, literal, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from database import async_session
+from entities import Report, DailyReport, DailyReportTotal
+from models import ReportResponse
+from report import create_excel_report_file
+from storage import get_store
+from uploads import run_upload
+from pipelines.report_summary import summarize_reports
+
+logger = logging.getLogger(__name__)
+
+tz = ZoneInfo("Europe/Moscow")
+
+TOTAL_KEY = ("report_on", "department_id", "operation_id", "crop_id")
+
+
+def _lock_key(report_on: date) -> int:
+    return zlib.crc32(f"daily_report:{report_on.isoformat()}".encode("utf-8"))
+
+
+def _is_problem(report: Report) -> bool:
+    # Так же отбирает проблемные отчеты сводка (summarize_reports)
+    return bool(report.note)
+
+
+async def add_to_daily_totals(session: AsyncSession, reports: list[Report]):
+    """
+    Добавляет сохраняемые отчеты к итогам их дней в той же транзакции.
+    Если итоги дня еще не построены, отчеты учтет rebuild_daily_totals после коммита.
+    """
+    if not reports:
+        return
+    # Нужны ID отчетов
+    await session.flush()
+    by_day: dict[date, list[Report]] = defaultdict(list)
+    for report in reports:
+        by_day[report.worked_on].append(report)
+
+    for report_on, day_reports in by_day.items():
+        # Разделяемая блокировка: инкременты не мешают друг другу, но не пересекаются с пересборкой дня
+        await session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": _lock_key(report_on)})
+        result = await session.execute(
+            update(DailyReport)
+            .where(DailyReport.report_on == report_on)
+            .values(
+                report_count=DailyReport.report_count + len(day_reports),
+                problem_count=DailyReport.problem_count + sum(map(_is_problem, day_reports)),
+                last_report_id=func.greatest(DailyReport.last_report_id, max(r.id for r in day_reports)),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            continue
+
+        groups: dict[tuple, dict] = {}
+        for report in day_reports:
+            key = (report_on, report.department_id, report.operation_id, report.crop_id)
+            row = groups.setdefault(key, {
+                **dict(zip(TOTAL_KEY, key)),
+                "report_count": 0,
+                "problem_count": 0,
+                "day_area": 0.0,
+                "day_yield": 0.0,
+            })
+            row["report_count"] += 1
+            row["problem_count"] += _is_problem(report)
+            row["day_area"] += report.day_area or 0.0
+            row["day_yield"] += report.day_yield or 0.0
+        stmt = insert(DailyReportTotal).values(list(groups.values()))
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=list(TOTAL_KEY),
+            set_={
+                column: getattr(DailyReportTotal, column) + getattr(stmt.excluded, column)
+                for column in ("report_count", "problem_count", "day_area", "day_yield")
+            },
+        ))
+
+
+async def rebuild_daily_totals(session: AsyncSession, report_on: date) -> DailyReport:
+    """Пересчитывает итоги дня по сохраненным отчетам и коммитит их"""
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _lock_key(report_on)})
+    problem = case((func.coalesce(Report.note, "") != "", 1), else_=0)
+    await session.execute(delete(DailyReportTotal).where(DailyReportTotal.report_on == report_on))
+    await session.execute(
+        insert(DailyReportTotal).from_select(
+            [*TOTAL_KEY, "report_count", "problem_count", "day_area", "day_yield"],
+            select(
+                literal(report_on),
+                Report.department_id,
+                Report.operation_id,
+                Report.crop_id,
+                func.count(),
+                func.sum(problem),
+                func.coalesce(func.sum(Report.day_area), 0.0),
+                func.coalesce(func.sum(Report.day_yield), 0.0),
+            )
+            .where(Report.worked_on == report_on)
+            .group_by(Report.department_id, Report.operation_id, Report.crop_id)
+        )
+    )
+    counts = (await session.execute(
+        select(func.count(), func.coalesce(func.sum(problem), 0), func.coalesce(func.max(Report.id), 0))
+        .where(Report.worked_on == report_on)
+    )).one()
+    stmt = insert(DailyReport).values(
+        report_on=report_on,
+        report_count=counts[0],
+        problem_count=counts[1],
+        last_report_id=counts[2],
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["report_on"],
+        set_={
+            "report_count": stmt.excluded.report_count,
+            "problem_count": stmt.excluded.problem_count,
+            "last_report_id": stmt.excluded.last_report_id,
+        },
+    ))
+    await session.commit()
+    logger.info(f"Rebuilt daily totals for {report_on}: {counts[0]} reports")
+    return await session.get(DailyReport, report_on, populate_existing=True)
+
+
+async def get_daily_totals(session: AsyncSession, report_on: date) -> list[DailyReportTotal]:
+    if await session.get(DailyReport, report_on) is None:
+        await rebuild_daily_totals(session, report_on)
+    return (await session.exec(
+        select(DailyReportTotal)
+        .where(DailyReportTotal.report_on == report_on)
+        .order_by(DailyReportTotal.department_id, DailyReportTotal.operation_id, DailyReportTotal.crop_id)
+    )).all()
+
+
+def _is_fresh(daily: Optional[DailyReport], key: tuple[int, int]) -> bool:
+    return (
+            daily is not None
+            and daily.file_url is not None
+            and (daily.artifact_report_id, daily.artifact_report_count) == key
+    )
+
+
+def _cached_response(daily: DailyReport) -> ReportResponse:
+    return ReportResponse(
+        created_at=daily.generated_at.replace(tzinfo=tz),
+        url=daily.file_url,
+        summary=daily.summary,
+    )
+
+
+async def _content_key(session: AsyncSession, report_on: date) -> tuple[int, int]:
+    """Версия содержимого отчетов дня: максимальный ID и количество (учитывает и удаление отчетов)"""
+    max_id, count = (await session.execute(
+        select(func.coalesce(func.max(Report.id), 0), func.count())
+        .where(Report.worked_on == report_on)
+    )).one()
+    return max_id, count
+
+
+# Сборки, выполняемые сейчас в процессе: (день, max ID, количество) -> задача
+_builds: dict[tuple[date, int, int], asyncio.Task] = {}
+stats = Counter()
+
+
+async def get_daily_report(report_at: datetime) -> ReportResponse:
+    """
+    Файл и сводка отчетов за день. Результат кэшируется по версии содержимого (max ID, количество отчетов):
+    пока она не изменилась, возвращается сохраненный результат без сборки Excel, загрузки и запроса к LLM.
+    Одновременные запросы одной версии в процессе ждут одну сборку, между репликами сборку дня выполняет
+    владелец аренды (daily_report.build_locked_until), остальные дожидаются ее результата.
+    """
+    report_on = report_at.date()
+    async with async_session() as session:
+        daily = await session.get(DailyReport, report_on)
+        if daily is None:
+            daily = await rebuild_daily_totals(session, report_on)
+        key = await _content_key(session, report_on)
+    if _is_fresh(daily, key):
+        stats["hits"] += 1
+        logger.info(f"Daily report for {report_on} is up to date ({key[1]} reports)")
+        return _cached_response(daily)
+
+    build_key = (report_on, *key)
+    task = _builds.get(build_key)
+    if task is None:
+        stats["builds"] += 1
+        task = asyncio.create_task(_build_daily_report(report_at, key))
+        _builds[build_key] = task
+        task.add_done_callback(lambda _: _builds.pop(build_key, None))
+    else:
+        stats["coalesced"] += 1
+        logger.info(f"Waiting for the daily report build for {report_on} in progress")
+    # Отмена одного запроса (например, разрыв соединения) не должна отменять общую сборку
+    return await asyncio.shield(task)
+
+
+async def _claim_build(report_on: date, key: tuple[int, int], token: str) -> tuple[Optional[tuple], list[Report]]:
+    """
+    Берет аренду сборки дня, если артефакты не соответствуют версии key и аренда свободна или истекла,
+    и читает отчеты дня. Транзакция коммитится сразу, соединение на время сборки не держится.
+
+    Returns:
+        Версия артефактов на момент взятия аренды (для записи результата с проверкой) и отчеты дня
+        либо None, если аренду взять не удалось
+    """
+    now = func.now()
+    async with async_session() as session:
+        claimed = (await session.execute(
+            update(DailyReport)
+            .where(DailyReport.report_on == report_on)
+            .where(or_(
+                DailyReport.file_url.is_(None),
+                DailyReport.artifact_report_id.is_distinct_from(key[0]),
+                DailyReport.artifact_report_count.is_distinct_from(key[1]),
+            ))
+            .where(or_(DailyReport.build_locked_until.is_(None), DailyReport.build_locked_until < now))
+            .values(
+                build_locked_until=now + timedelta(seconds=settings.daily_report_lease_seconds),
+                build_locked_by=token,
+            )
+            .returning(DailyReport.artifact_report_id, DailyReport.artifact_report_count)
+            .execution_options(synchronize_session=False)
+        )).first()
+        reports: list[Report] = []
+        if claimed is not None:
+            reports = (await session.exec(
+                select(Report)
+                .options(
+                    selectinload(Report.department),
+                    selectinload(Report.operation),
+                    selectinload(Report.crop)
+                )
+                .where(Report.worked_on == report_on)
+                .order_by(Report.id)
+            )).all()
+        await session.commit()
+    return (tuple(claimed) if claimed is not None else None), reports
+
+
+async def _release_build(report_on: date, token: str):
+    async with async_session() as session:
+        await session.execute(
+            update(DailyReport)
+            .where(DailyReport.report_on == report_on)
+            .where(DailyReport.build_locked_by == token)
+            .values(build_locked_until=None, build_locked_by=None)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+async def _build_daily_report(report_at: datetime, key: tuple[int, int]) -> ReportResponse:
+    report_on = report_at.date()
+    # Аренда помечается сборкой, а не процессом: в одном процессе могут идти сборки разных версий дня
+    token = f"{settings.worker_id}:{uuid4().hex}"
+    waiting = False
+    while True:
+        claimed, reports = await _claim_build(report_on, key, token)
+        if claimed is not None:
+            break
+        async with async_session() as session:
+            daily = await session.get(DailyReport, report_on, populate_existing=True)
+            if daily is None:
+                daily = await rebuild_daily_totals(session, report_on)
+                continue
+        if _is_fresh(daily, key):
+            stats["hits"] += 1
+            return _cached_response(daily)
+        # Между репликами день собирает только владелец аренды, остальные ждут его результат
+        if not waiting:
+            waiting = True
+            stats["waits"] += 1
+            logger.info(f"Waiting for the daily report build for {report_on} by {daily.build_locked_by}")
+        await asyncio.sleep(settings.daily_report_poll_interval)
+
+    try:
+        filename, content = await asyncio.to_thread(create_excel_report_file, report_at, reports)
+        _, file_url = await run_upload(get_store().put_spreadsheet, filename, content)
+
+        logger.info(f"Запуск анализа {len(reports)} отчетов")
+        summary = await summarize_reports(reports)
+
+        # Счетчики дня могли измениться параллельно, поэтому обновляются только поля артефактов и только если
+        # их не перезаписала другая сборка (например, после истечения аренды этой)
+        async with async_session() as session:
+            result = await session.execute(
+                update(DailyReport)
+                .where(DailyReport.report_on == report_on)
+                .where(DailyReport.artifact_report_id.is_not_distinct_from(claimed[0]))
+                .where(DailyReport.artifact_report_count.is_not_distinct_from(claimed[1]))
+                .values(
+                    # Версия берется по фактически вошедшим в файл отчетам
+                    artifact_report_id=reports[-1].id if reports else 0,
+                    artifact_report_count=len(reports),
+                    file_url=file_url,
+                    summary=summary,
+                    generated_at=report_at.replace(tzinfo=None),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        if result.rowcount == 0:
+            logger.warning(f"Daily report for {report_on} was rebuilt concurrently, keeping the stored one")
+    finally:
+        await _release_build(report_on, token)
+    return ReportResponse(
+        created_at=report_at,
+        url=file_url,
+        summary=summary,
+    )
@@ -1,24 +1,105 @@
 import csv
 import logging
 import os
+import statistics
+import time
+import zlib
+from collections import Counter, deque
 from typing import AsyncGenerator, Any
 
-from sqlalchemy import text, select, func
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import exc, text, inspect
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlmodel import select, SQLModel
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from config import settings
-from entities import Department, Operation, Crop, ChatMessage
+from entities import Department, Operation, Crop, UserSerialCounter
 
 logger = logging.getLogger(__name__)
 
+# Сколько последних ожиданий соединения учитывается в перцентилях
+POOL_WAIT_WINDOW = 500
+
+pool_stats = Counter()
+_pool_waits: deque[float] = deque(maxlen=POOL_WAIT_WINDOW)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats["timeouts"] += 1
+            raise
+        finally:
+            _pool_waits.append(time.perf_counter() - start)
+
+
 async_engine = create_async_engine(
     settings.db_url,
-    echo=True,
-    future=True,
+    echo=settings.db_echo,
+    poolclass=MeteredQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    connect_args={
+        # Кэш asyncpg и кэш подготовленных выражений диалекта SQLAlchemy
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+    },
 )
 
+
+def required_connections() -> int:
+    """
+    Оценка снизу числа соединений, одновременно занятых процессом. Запросы API сверх одного
+    и короткие сессии (например, перечитывание справочников) сюда не входят.
+    """
+    # Запрос API и сборка отчета за день (соединение нужно ей только на чтение отчетов и запись результата,
+    # на время запроса к LLM его берет кэш ответов)
+    required = 2
+    if settings.job_worker_enabled:
+        # По соединению на задачу (на время запроса к LLM задача отпускает свое, и его берет кэш ответов),
+        # LISTEN и выбор задач
+        required += settings.job_concurrency + 2
+    if settings.google_drive_folder_dumped:
+        # Выгрузка отчетов за день и поиск подпапок обработчиками фоновых загрузок
+        required += 1 + settings.upload_workers
+    return required
+
+
+if settings.db_pool_size + settings.db_max_overflow < required_connections():
+    logger.warning(
+        f"DB pool ({settings.db_pool_size} + {settings.db_max_overflow} overflow) is smaller than "
+        f"at least {required_connections()} connections used concurrently by jobs, LISTEN, uploads and API, "
+        f"requests may wait for connections"
+    )
+
+
+def pool_metrics() -> dict:
+    pool = async_engine.pool
+    waits = sorted(_pool_waits)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "timeouts": pool_stats["timeouts"],
+        "wait_avg_seconds": statistics.mean(waits) if waits else None,
+        "wait_p95_seconds": waits[int(len(waits) * 0.95)] if waits else None,
+        "wait_max_seconds": waits[-1] if waits else None,
+    }
+
+
 async_session = async_sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
@@ -26,9 +107,28 @@ async_session = async_sessionmaker(
 )
 
 
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Базы, созданные до появления миграций (SQLModel.metadata.create_all), содержат исходную схему
+BASELINE_REVISION = "0001"
+MIGRATIONS_LOCK_KEY = zlib.crc32(b"alembic_migrations")
+
+
+def run_migrations(connection):
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_PATH)
+    config.attributes["connection"] = connection
+    # Реплики, стартующие одновременно, применяют миграции по очереди
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+    inspector = inspect(connection)
+    if not inspector.has_table("alembic_version") and inspector.has_table("chat_message"):
+        logger.info(f"Database was created without migrations, stamping revision {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
+
 async def init_db():
     async with async_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
 
 async def get_async_session_as_generator() -> AsyncGenerator[AsyncSession, Any]:
@@ -83,14 +183,25 @@ async def load_dicts():
         await session.commit()
 
 
-async def get_next_serial_num(session: AsyncSession, user_id: str) -> int:
-    # Хешируем user_id в int64 (можно заменить на crc32, если хочешь стабильность между перезапусками)
-    lock_key = abs(hash(user_id)) % (2 ** 31)
+async def allocate_serial_nums(session: AsyncSession, counts: dict[str, int]) -> dict[str, int]:
+    """
+    Выделяет порядковые номера сообщений сразу для нескольких пользователей одним атомарным upsert.
+    Строки счетчиков блокируются до конца транзакции, поэтому номера не повторяются между репликами,
+    а при откате транзакции откатываются и счетчики - номера идут без пропусков.
+
+    Args:
+        counts: user_id -> сколько номеров нужно
+
+    Returns:
+        user_id -> первый выделенный номер (остальные идут следом)
+    """
+    # Строки блокируются в одном порядке во всех транзакциях, чтобы не было взаимных блокировок
+    rows = [{"user_id": user_id, "last_serial": count} for user_id, count in sorted(counts.items())]
+    stmt = insert(UserSerialCounter).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserSerialCounter.user_id],
+        set_={"last_serial": UserSerialCounter.last_serial + stmt.excluded.last_serial},
+    ).returning(UserSerialCounter.user_id, UserSerialCounter.last_serial)
+    result = await session.execute(stmt)
+    return {user_id: last_serial - counts[user_id] + 1 for user_id, last_serial in result.all()}
 
-    await session.execute(text(f"SELECT pg_advisory_xact_lock({lock_key})"))
-
-    result = await session.exec(
-        select(func.coalesce(func.max(ChatMessage.serial_num), 0))
-        .where(ChatMessage.user_id == user_id)
-    )
-    return result.one() + 1
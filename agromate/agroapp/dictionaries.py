@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+from sqlmodel import select
+
+from config import settings
+from database import async_session
+from entities import Department, Operation, Crop, DictionaryVersion
+from pipelines.entity_resolution import FuzzyMatcher
+from pipelines.utils import (
+    extract_department_names,
+    dictionary_version,
+    EntityIndex,
+    build_department_index,
+    build_operation_index,
+    build_crop_index,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DictionarySnapshot:
+    """
+    Неизменяемый снимок справочников с заранее вычисленными названиями и индексами.
+    Объекты справочников отсоединены от сессии и используются только для чтения.
+    """
+    version: int
+    departments: list[Department]
+    operations: list[Operation]
+    crops: list[Crop]
+    department_names: tuple[str, ...]
+    operation_names: tuple[str, ...]
+    crop_names: tuple[str, ...]
+    departments_by_id: dict[int, Department]
+    operations_by_id: dict[int, Operation]
+    crops_by_id: dict[int, Crop]
+    # Нормализованные названия, номера и алиасы -> ID для сопоставления ответов LLM
+    department_index: EntityIndex
+    operation_index: EntityIndex
+    crop_index: EntityIndex
+    # Нечеткое сопоставление значений, не найденных в индексах
+    department_matcher: FuzzyMatcher
+    operation_matcher: FuzzyMatcher
+    crop_matcher: FuzzyMatcher
+    # Хеш названий - ключ кэшей схем и промптов
+    names_hash: str
+
+    @classmethod
+    def build(
+            cls,
+            version: int,
+            departments: list[Department],
+            operations: list[Operation],
+            crops: list[Crop],
+    ) -> "DictionarySnapshot":
+        department_names = extract_department_names(departments)
+        department_index = build_department_index(departments)
+        operation_index = build_operation_index(operations)
+        crop_index = build_crop_index(crops)
+        operation_names = tuple(op.operation_name for op in operations)
+        crop_names = tuple(crop.crop_name for crop in crops)
+        return cls(
+            version=version,
+            departments=list(departments),
+            operations=list(operations),
+            crops=list(crops),
+            department_names=department_names,
+            operation_names=operation_names,
+            crop_names=crop_names,
+            departments_by_id={d.id: d for d in departments},
+            operations_by_id={o.id: o for o in operations},
+            crops_by_id={c.id: c for c in crops},
+            department_index=department_index,
+            operation_index=operation_index,
+            crop_index=crop_index,
+            department_matcher=FuzzyMatcher(department_index),
+            operation_matcher=FuzzyMatcher(operation_index),
+            crop_matcher=FuzzyMatcher(crop_index),
+            names_hash=dictionary_version(department_names, operation_names, crop_names),
+        )
+
+
+_snapshot: Optional[DictionarySnapshot] = None
+_checked_at = 0.0
+_lock = asyncio.Lock()
+_reload_listeners: list[Callable[[DictionarySnapshot], None]] = []
+
+
+def add_reload_listener(listener: Callable[[DictionarySnapshot], None]):
+    _reload_listeners.append(listener)
+
+
+async def _get_version(session) -> int:
+    version = (await session.exec(
+        select(DictionaryVersion.version).where(DictionaryVersion.id == 1)
+    )).one_or_none()
+    return version or 0
+
+
+async def load_dictionary_snapshot() -> DictionarySnapshot:
+    global _snapshot, _checked_at
+    async with async_session() as session:
+        version = await _get_version(session)
+        departments: list[Department] = (await session.exec(select(Department).order_by(Department.id))).all()
+        operations: list[Operation] = (await session.exec(select(Operation).order_by(Operation.id))).all()
+        crops: list[Crop] = (await session.exec(select(Crop).order_by(Crop.id))).all()
+    _snapshot = DictionarySnapshot.build(version, departments, operations, crops)
+    _checked_at = time.monotonic()
+    logger.info(
+        f"Loaded dictionaries version {version}: "
+        f"{len(departments)} departments, {len(operations)} operations, {len(crops)} crops"
+    )
+    for listener in _reload_listeners:
+        listener(_snapshot)
+    return _snapshot
+
+
+async def get_dictionaries() -> DictionarySnapshot:
+    """
+    Возвращает текущий снимок справочников. Версия справочников в БД проверяется
+    не чаще чем раз в dictionary_refresh_seconds, снимок перечитывается только при ее смене.
+    """
+    global _checked_at
+    if _snapshot is not None and time.monotonic() - _checked_at < settings.dictionary_refresh_seconds:
+        return _snapshot
+    async with _lock:
+        if _snapshot is None:
+            return await load_dictionary_snapshot()
+        if time.monotonic() - _checked_at >= settings.dictionary_refresh_seconds:
+            async with async_session() as session:
+                version = await _get_version(session)
+            _checked_at = time.monotonic()
+            if version != _snapshot.version:
+                logger.info(f"Dictionaries changed: version {_snapshot.version} -> {version}")
+                return await load_dictionary_snapshot()
+    return _snapshot
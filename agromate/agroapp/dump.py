@@ -1,26 +1,28 @@
+import asyncio
+import io
 import logging
-import os
-import tempfile
-from datetime import date
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 from typing import Optional
 
 from docx import Document
 from openpyxl.workbook import Workbook
+from sqlalchemy import func, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
 
 from config import settings
+from database import async_session
 from entities import ChatMessage
-from entities import Report
-from google_drive import upload_word_file_to_folder, upload_excel_file_to_folder, overwrite_excel_file_by_id
-from report import append_reports_to_excel, create_excel_report, save_excel
+from entities import Report, ReportDump, DriveFolder
+from report import append_reports_to_excel, create_excel_report, excel_to_bytes
+from storage import get_store
+from uploads import run_upload, submit_upload
 
 logger = logging.getLogger(__name__)
 
-_current_report_on: Optional[date] = None
-_current_wb: Optional[Workbook] = None
-_current_next_row: Optional[int] = None
-_current_file_id: Optional[str] = None
-
-
 def dump_message_silently(chat_message: ChatMessage):
     try:
         doc = Document()
@@ -31,42 +33,213 @@ def dump_message_silently(chat_message: ChatMessage):
         safe_username = chat_message.username.replace(" ", "_")
         # ИмяОтправителя_Номер-сообщения_МинутаЧасДеньМесяцГод
         filename = f"{safe_username}_{chat_message.serial_num}_{ts}.docx"
-        file_path = os.path.join(tempfile.gettempdir(), filename)
         # ДеньМесяцГод
         subfolder_name = f"Сообщения от {chat_message.created_at.strftime('%d.%m.%Y')}"
 
-        with open(file_path, "w+t"):
-            doc.save(file_path)
+        output = io.BytesIO()
+        doc.save(output)
 
-        upload_word_file_to_folder(file_path, subfolder_name)
-        logger.info(f"Created message dump file: {file_path}")
+        # Загрузка выполняется в фоне, обработка сообщения ее не ждет
+        submit_upload(_upload_message_dump(filename, output.getvalue(), subfolder_name))
+        logger.info(f"Created message dump file: {filename}")
     except Exception as e:
         logger.error(f"Error: {e}", exc_info=True)
 
 
-def dump_report_silently(chat_message: ChatMessage, reports: list[Report]):
-    global _current_wb, _current_next_row, _current_report_on, _current_file_id
-    try:
-        report_on = chat_message.created_at.date()
-        if _current_wb is None or _current_report_on != report_on:
-            _current_wb, _current_next_row = create_excel_report(report_on, reports)
-            _current_report_on = report_on
-            _current_file_id = None
-        else:
-            _current_next_row = append_reports_to_excel(_current_wb, _current_next_row, reports)
-
-        ts = chat_message.created_at.strftime("%H%d%m%Y")
-        # ЧасДеньМесяцГод_НазваниеКоманды
-        filename = f"{ts}_{settings.team_name}.xlsx"
-        file_path = os.path.join(tempfile.gettempdir(), filename)
-
-        save_excel(_current_wb, file_path)
-
-        if _current_file_id is None:
-            _current_file_id, _ = upload_excel_file_to_folder(file_path)
-            logger.info(f"Created report dump file: {file_path}")
-        else:
-            overwrite_excel_file_by_id(_current_file_id, file_path)
-            logger.info(f"Updated report dump file: {file_path}")
-    except Exception as e:
-        logger.error(f"Error: {e}", exc_info=True)
+async def _upload_message_dump(filename: str, content: bytes, subfolder_name: str):
+    subfolder_id = await resolve_subfolder_id(subfolder_name)
+    await run_upload(get_store().put_document, filename, content, subfolder_id)
+
+
+_folder_ids: dict[str, str] = {}
+_folder_locks: dict[str, asyncio.Lock] = {}
+
+
+async def resolve_subfolder_id(subfolder_name: str) -> str:
+    """
+    ID подпапки хранилища: из памяти, из таблицы drive_folder или (один раз) через API хранилища.
+    Создание выполняется под блокировкой - одной в процессе и advisory-блокировкой в БД между процессами,
+    поэтому одновременные первые сообщения дня не создают дубликаты папок.
+    """
+    store = get_store()
+    if not store.remote_folders:
+        return await run_upload(store.get_folder, subfolder_name)
+    if subfolder_name in _folder_ids:
+        return _folder_ids[subfolder_name]
+    async with _folder_locks.setdefault(subfolder_name, asyncio.Lock()):
+        if subfolder_name in _folder_ids:
+            return _folder_ids[subfolder_name]
+        async with async_session() as session:
+            lock_key = zlib.crc32(f"drive_folder:{subfolder_name}".encode("utf-8"))
+            await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": lock_key})
+            folder: Optional[DriveFolder] = (await session.exec(
+                select(DriveFolder).where(DriveFolder.name == subfolder_name)
+            )).one_or_none()
+            if folder is None:
+                folder = DriveFolder(
+                    name=subfolder_name,
+                    folder_id=await run_upload(store.get_folder, subfolder_name),
+                )
+                session.add(folder)
+            await session.commit()
+        _folder_ids[subfolder_name] = folder.folder_id
+        _folder_locks.pop(subfolder_name, None)
+        return folder.folder_id
+
+
+@dataclass
+class DumpState:
+    """Книга выгрузки за день в памяти и последний записанный в нее отчет"""
+    report_on: date
+    wb: Workbook
+    next_row: int
+    last_report_id: int
+
+
+# Удвоение паузы между выгрузками после неудачной ограничено этой степенью
+MAX_RETRY_EXPONENT = 5
+
+_state: Optional[DumpState] = None
+# Дни с новыми отчетами -> время первого сообщения (для имени файла)
+_pending: dict[date, datetime] = {}
+_flush_task: Optional[asyncio.Task] = None
+# Подряд идущие выгрузки с ошибками, от них зависит пауза перед повтором
+_failed_rounds = 0
+
+
+def schedule_report_dump(created_at: datetime):
+    """
+    Отмечает, что за день появились новые отчеты. Выгрузка выполняется не чаще
+    раза в report_dump_debounce_seconds и забирает из БД все отчеты, накопившиеся за это время.
+    """
+    global _flush_task
+    _pending.setdefault(created_at.date(), created_at)
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_pending())
+
+
+async def resume_report_dumps():
+    """Планирует выгрузку отчетов, не попавших в файлы до перезапуска"""
+    since = date.today() - timedelta(days=1)
+    async with async_session() as session:
+        days = (await session.exec(
+            select(Report.worked_on)
+            .outerjoin(ReportDump, ReportDump.report_on == Report.worked_on)
+            .where(Report.worked_on >= since)
+            .where(Report.id > func.coalesce(ReportDump.last_report_id, 0))
+            .group_by(Report.worked_on)
+        )).all()
+    for report_on in days:
+        logger.info(f"Resuming report dump for {report_on}")
+        schedule_report_dump(datetime.combine(report_on, datetime.now().time()))
+
+
+async def _flush_pending():
+    global _failed_rounds
+    while _pending:
+        # После ошибок пауза растет экспоненциально, чтобы не долбить недоступное хранилище
+        await asyncio.sleep(settings.report_dump_debounce_seconds * 2 ** min(_failed_rounds, MAX_RETRY_EXPONENT))
+        pending = dict(_pending)
+        _pending.clear()
+        failed = False
+        for report_on, created_at in sorted(pending.items()):
+            try:
+                await flush_report_dump(report_on, created_at)
+            except Exception as e:
+                logger.error(f"Error of dumping reports on {report_on}: {e}", exc_info=True)
+                # День возвращается в очередь, не дожидаясь новых отчетов или перезапуска
+                _pending.setdefault(report_on, created_at)
+                failed = True
+        _failed_rounds = _failed_rounds + 1 if failed else 0
+
+
+def _reports_on(report_on: date, after_id: int = 0):
+    return (
+        select(Report)
+        .options(
+            selectinload(Report.department),
+            selectinload(Report.operation),
+            selectinload(Report.crop)
+        )
+        .where(Report.worked_on == report_on)
+        .where(Report.id > after_id)
+        .order_by(Report.id)
+    )
+
+
+def _update_workbook(
+        state: Optional[DumpState],
+        report_on: date,
+        delta: list[Report],
+        reports: Optional[list[Report]],
+) -> tuple[DumpState, bytes]:
+    """Дописывает отчеты в книгу дня (или строит ее заново по reports) и сериализует ее. Выполняется в потоке."""
+    if reports is None:
+        state.next_row = append_reports_to_excel(state.wb, state.next_row, delta)
+    else:
+        wb, next_row = create_excel_report(report_on, reports)
+        state = DumpState(report_on=report_on, wb=wb, next_row=next_row, last_report_id=0)
+    state.last_report_id = delta[-1].id
+    return state, excel_to_bytes(state.wb)
+
+
+async def flush_report_dump(report_on: date, created_at: datetime):
+    """
+    Дописывает в книгу дня отчеты, появившиеся после последней выгрузки, и загружает файл один раз.
+    Если книга в памяти отстала от БД (перезапуск, выгрузка другим процессом), она перестраивается из таблицы report.
+    Транзакция не держится во время сборки книги и загрузки: выгруженная версия записывается после загрузки
+    при условии, что строку report_dump за это время не обновил другой процесс, иначе день выгружается заново.
+    """
+    global _state
+    async with async_session() as session:
+        await session.execute(
+            insert(ReportDump)
+            .values(report_on=report_on, last_report_id=0, updated_at=datetime.now())
+            .on_conflict_do_nothing(index_elements=[ReportDump.report_on])
+        )
+        dump: ReportDump = (await session.exec(
+            select(ReportDump).where(ReportDump.report_on == report_on)
+        )).one()
+        delta: list[Report] = (await session.exec(_reports_on(report_on, dump.last_report_id))).all()
+        state = _state
+        reports: Optional[list[Report]] = None
+        if delta and not (
+                state is not None and state.report_on == report_on and state.last_report_id == dump.last_report_id
+        ):
+            reports = (await session.exec(_reports_on(report_on))).all()
+        await session.commit()
+    if not delta:
+        return
+
+    ts = created_at.strftime("%H%d%m%Y")
+    # ЧасДеньМесяцГод_НазваниеКоманды
+    filename = f"{ts}_{settings.team_name}.xlsx"
+    # Книга в памяти меняется на месте, до записи версии в БД она считается недостоверной
+    _state = None
+    state, content = await asyncio.to_thread(_update_workbook, state, report_on, delta, reports)
+    if reports is None:
+        logger.info(f"Appended {len(delta)} reports to dump on {report_on}")
+    else:
+        logger.info(f"Rebuilt dump on {report_on} from {len(reports)} reports")
+
+    file_id = dump.file_id
+    if file_id is None:
+        file_id, _ = await run_upload(get_store().put_spreadsheet, filename, content)
+        logger.info(f"Created report dump file: {filename}")
+    else:
+        await run_upload(get_store().overwrite_spreadsheet, file_id, filename, content)
+        logger.info(f"Updated report dump file: {filename}")
+
+    async with async_session() as session:
+        result = await session.execute(
+            update(ReportDump)
+            .where(ReportDump.report_on == report_on)
+            .where(ReportDump.last_report_id == dump.last_report_id)
+            .where(ReportDump.file_id.is_not_distinct_from(dump.file_id))
+            .values(file_id=file_id, last_report_id=state.last_report_id, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    if result.rowcount == 0:
+        raise RuntimeError(f"Report dump on {report_on} was updated concurrently, it will be uploaded again")
+    _state = state
@@ -0,0 +1,96 @@
+import hashlib
+import re
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import cast, func
+from sqlalchemy.dialects.postgresql import BIT
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from entities import ChatMessage
+from models import MessageStatus
+
+# Разрядность SimHash, значение хранится в BIGINT
+SIMHASH_BITS = 64
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_message_text(text: str) -> str:
+    return " ".join(text.replace("\xa0", " ").casefold().replace("ё", "е").split())
+
+
+def content_hash(text: str) -> str:
+    """Хеш нормализованного текста: совпадает у пересланных и повторно отправленных копий"""
+    return hashlib.sha256(normalize_message_text(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """
+    SimHash по словам текста: у похожих текстов отличается в небольшом числе бит.
+    Отчеты короткие, поэтому признаками служат отдельные слова, а не их пары.
+    Возвращается как знаковое 64-битное число, чтобы помещаться в BIGINT.
+    """
+    weights = [0] * SIMHASH_BITS
+    for token in TOKEN_PATTERN.findall(normalize_message_text(text)):
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    return fingerprint - (1 << SIMHASH_BITS) if fingerprint >= 1 << (SIMHASH_BITS - 1) else fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << SIMHASH_BITS) - 1)).bit_count()
+
+
+class OriginalPendingError(Exception):
+    """Оригинал сообщения еще обрабатывается - копию нужно отложить до его результата"""
+
+    def __init__(self, original_id: int):
+        super().__init__(f"Сообщение является копией {original_id}, которое еще обрабатывается")
+        self.original_id = original_id
+
+
+def _earlier_messages(chat_message: ChatMessage):
+    window_start = chat_message.created_at - timedelta(hours=settings.duplicate_window_hours)
+    return (
+        select(ChatMessage)
+        .where(ChatMessage.id < chat_message.id)
+        .where(ChatMessage.created_at >= window_start)
+        # Упавшие сообщения не переиспользуются - копия обрабатывается заново
+        .where(ChatMessage.status != MessageStatus.failed)
+        .where(ChatMessage.duplicate_of_id.is_(None))
+        .order_by(ChatMessage.id.desc())
+        .limit(1)
+    )
+
+
+async def find_exact_duplicate(session: AsyncSession, chat_message: ChatMessage) -> Optional[ChatMessage]:
+    """
+    Более раннее сообщение с тем же нормализованным текстом от того же пользователя в том же чате за тот же день.
+    Результат копии переиспользуется без создания отчетов, а отчеты датируются днем сообщения,
+    поэтому такой же короткий отчет другой бригады или за другой день копией не считается.
+    """
+    if not chat_message.content_hash:
+        return None
+    day_start = chat_message.created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (await session.exec(
+        _earlier_messages(chat_message)
+        .where(ChatMessage.content_hash == chat_message.content_hash)
+        .where(ChatMessage.chat_id == chat_message.chat_id)
+        .where(ChatMessage.user_id == chat_message.user_id)
+        .where(ChatMessage.created_at >= day_start)
+        .where(ChatMessage.created_at < day_start + timedelta(days=1))
+    )).one_or_none()
+
+
+async def find_near_duplicate(session: AsyncSession, chat_message: ChatMessage) -> Optional[ChatMessage]:
+    """Более раннее сообщение, SimHash которого отличается не больше чем на near_duplicate_distance бит"""
+    if chat_message.simhash is None:
+        return None
+    distance = func.bit_count(cast(ChatMessage.simhash.op("#")(chat_message.simhash), BIT(SIMHASH_BITS)))
+    return (await session.exec(
+        _earlier_messages(chat_message).where(distance <= settings.near_duplicate_distance)
+    )).one_or_none()
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 from typing import Optional, List
 
+from sqlalchemy import BigInteger, Index, UniqueConstraint, text
 from sqlmodel import Field, SQLModel, Relationship
 
 from models import MessageStatus
@@ -8,6 +9,14 @@ from models import MessageStatus
 
 class ChatMessage(SQLModel, table=True):
     __tablename__ = "chat_message"
+    __table_args__ = (
+        # Одно сообщение Telegram сохраняется один раз, повторные доставки игнорируются
+        UniqueConstraint("chat_id", "message_id", name="uq_chat_message_chat_id_message_id"),
+        # Следующий порядковый номер сообщения пользователя
+        Index("ix_chat_message_user_id_serial_num", "user_id", "serial_num"),
+        # Выбор задач воркером: обработанные сообщения в индекс не попадают
+        Index("ix_chat_message_pending", "id", postgresql_where=text("status IN ('new', 'processing')")),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     serial_num: int = Field(default=0)
@@ -15,14 +24,35 @@ class ChatMessage(SQLModel, table=True):
     user_id: str
     chat_id: str
     message_id: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(datetime.UTC))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(datetime.UTC), index=True)
     message_text: str
     status: MessageStatus = Field(default=MessageStatus.new)
     status_text: Optional[str] = None
+    # Очередь обработки: число попыток, время следующей попытки и аренда воркера
+    attempts: int = Field(default=0)
+    available_at: Optional[datetime] = Field(default=None, nullable=True)
+    locked_until: Optional[datetime] = Field(default=None, nullable=True)
+    # Процесс, взявший задачу в работу (settings.worker_id)
+    locked_by: Optional[str] = Field(default=None, nullable=True)
+    # Отпечатки текста для поиска повторно присланных отчетов
+    content_hash: Optional[str] = Field(default=None, nullable=True, index=True)
+    simhash: Optional[int] = Field(default=None, nullable=True, sa_type=BigInteger)
+    # Сообщение, результат которого переиспользован (точная копия)
+    duplicate_of_id: Optional[int] = Field(default=None, foreign_key="chat_message.id", nullable=True)
+    # Похожее сообщение (отличается незначительно), только пометка - обрабатывается как обычно
+    near_duplicate_of_id: Optional[int] = Field(default=None, foreign_key="chat_message.id", nullable=True)
 
     report: List["Report"] = Relationship(back_populates="chat_message")
 
 
+class UserSerialCounter(SQLModel, table=True):
+    """Последний выданный порядковый номер сообщения пользователя (serial_num)"""
+    __tablename__ = "user_serial_counter"
+
+    user_id: str = Field(primary_key=True)
+    last_serial: int = Field(default=0)
+
+
 class Department(SQLModel, table=True):
     __tablename__ = "department"
 
@@ -56,13 +86,33 @@ class Crop(SQLModel, table=True):
     report: List["Report"] = Relationship(back_populates="crop")
 
 
+class DictionaryVersion(SQLModel, table=True):
+    """Счетчик изменений справочников, увеличивается триггерами на department/operation/crop"""
+    __tablename__ = "dictionary_version"
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+
+
+class LLMCacheEntry(SQLModel, table=True):
+    """Закэшированный ответ LLM, ключ - хеш модели, температуры, промпта и схемы ответа"""
+    __tablename__ = "llm_cache"
+
+    key: str = Field(primary_key=True)
+    model_name: str
+    response: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    accessed_at: datetime = Field(default_factory=datetime.now, index=True)
+    hits: int = Field(default=0)
+
+
 class Report(SQLModel, table=True):
     __tablename__ = "report"
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    worked_on: date
+    worked_on: date = Field(index=True)
 
-    chat_message_id: int = Field(foreign_key="chat_message.id")
+    chat_message_id: int = Field(foreign_key="chat_message.id", index=True)
     department_id: Optional[int] = Field(foreign_key="department.id", nullable=True)
     operation_id: Optional[int] = Field(foreign_key="operation.id", nullable=True)
     crop_id: Optional[int] = Field(foreign_key="crop.id", nullable=True)
@@ -75,6 +125,12 @@ class Report(SQLModel, table=True):
     operation_predicted: Optional[str] = Field(default=None, nullable=True)
     crop_predicted: Optional[str] = Field(default=None, nullable=True)
 
+    # Уверенность сопоставления со справочником: 1.0 - точное совпадение,
+    # меньше - значение сопоставлено нечетким поиском
+    department_confidence: Optional[float] = Field(default=None, nullable=True)
+    operation_confidence: Optional[float] = Field(default=None, nullable=True)
+    crop_confidence: Optional[float] = Field(default=None, nullable=True)
+
     note: Optional[str] = Field(default=None, nullable=True)
 
     day_area: float
@@ -86,3 +142,69 @@ class Report(SQLModel, table=True):
     department: Optional[Department] = Relationship(back_populates="report")
     operation: Optional[Operation] = Relationship(back_populates="report")
     crop: Optional[Crop] = Relationship(back_populates="report")
+
+
+class ReportDump(SQLModel, table=True):
+    """Файл выгрузки отчетов за день в Google Drive и последний выгруженный в него отчет"""
+    __tablename__ = "report_dump"
+
+    report_on: date = Field(primary_key=True)
+    file_id: Optional[str] = Field(default=None, nullable=True)
+    last_report_id: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class DriveFolder(SQLModel, table=True):
+    """Созданные в Google Drive подпапки (например, "Сообщения от dd.mm.yyyy")"""
+    __tablename__ = "drive_folder"
+
+    name: str = Field(primary_key=True)
+    folder_id: str
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class DailyReport(SQLModel, table=True):
+    """
+    Итоги отчетов за день и сгенерированные по ним артефакты (файл и сводка).
+    Счетчики увеличиваются при сохранении отчетов, артефакты пересобираются,
+    только если после их генерации появились новые отчеты.
+    """
+    __tablename__ = "daily_report"
+
+    report_on: date = Field(primary_key=True)
+    report_count: int = Field(default=0)
+    problem_count: int = Field(default=0)
+    last_report_id: int = Field(default=0)
+    # Версия отчетов (последний ID и количество), по которой собраны file_url и summary
+    artifact_report_id: Optional[int] = Field(default=None, nullable=True)
+    artifact_report_count: Optional[int] = Field(default=None, nullable=True)
+    file_url: Optional[str] = Field(default=None, nullable=True)
+    summary: Optional[str] = Field(default=None, nullable=True)
+    generated_at: Optional[datetime] = Field(default=None, nullable=True)
+    # Аренда сборки артефактов: между репликами день собирает только ее владелец
+    build_locked_until: Optional[datetime] = Field(default=None, nullable=True)
+    build_locked_by: Optional[str] = Field(default=None, nullable=True)
+
+
+class DailyReportTotal(SQLModel, table=True):
+    """Суммы отчетов за день в разрезе подразделения, операции и культуры"""
+    __tablename__ = "daily_report_total"
+    __table_args__ = (
+        # Нераспознанные значения (NULL) тоже образуют отдельную группу
+        Index(
+            "ix_daily_report_total_key",
+            "report_on", "department_id", "operation_id", "crop_id",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    report_on: date
+    department_id: Optional[int] = Field(default=None, foreign_key="department.id", nullable=True)
+    operation_id: Optional[int] = Field(default=None, foreign_key="operation.id", nullable=True)
+    crop_id: Optional[int] = Field(default=None, foreign_key="crop.id", nullable=True)
+    report_count: int = Field(default=0)
+    problem_count: int = Field(default=0)
+    day_area: float = Field(default=0.0)
+    day_yield: float = Field(default=0.0)
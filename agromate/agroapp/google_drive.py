@@ -1,10 +1,12 @@
+import io
 import logging
-import os
 import re
+import threading
+from functools import lru_cache
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 
 from config import settings
 
@@ -27,100 +29,113 @@ def create_service_account():
     return build('drive', 'v3', credentials=creds)
 
 
-folder_id = get_folder_id_from_url(settings.google_drive_folder_url)
-sa = create_service_account()
+@lru_cache(maxsize=1)
+def get_root_folder_id() -> str:
+    # Разбирается при первом обращении, а не при импорте: без настроек Drive приложение должно запускаться
+    return get_folder_id_from_url(settings.google_drive_folder_url)
 
 
-def upload_word_file_to_folder(file_path: str, subfolder_name: str) -> tuple[str, str]:
-    try:
-        resp = sa.files().list(
-            q=(
-                "mimeType='application/vnd.google-apps.folder' "
-                f"and name='{subfolder_name}' "
-                "and trashed=false "
-                f"and '{folder_id}' in parents"
-            ),
-            spaces='drive',
-            fields='files(id,name)'
-        ).execute()
-        files = resp.get('files', [])
-        if files:
-            subfolder_id = files[0]['id']
-        else:
-            folder_metadata = {
-                'name': subfolder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [folder_id]
-            }
-            created = sa.files().create(body=folder_metadata, fields='id').execute()
-            subfolder_id = created['id']
-            logger.info(f"Created subfolder: {subfolder_name}")
+# Клиент googleapiclient (httplib2) не потокобезопасен, у каждого потока загрузок он свой
+_local = threading.local()
+
+
+def get_service():
+    if not hasattr(_local, "sa"):
+        _local.sa = create_service_account()
+    return _local.sa
 
+
+def find_or_create_subfolder(subfolder_name: str) -> str:
+    resp = get_service().files().list(
+        q=(
+            "mimeType='application/vnd.google-apps.folder' "
+            f"and name='{subfolder_name}' "
+            "and trashed=false "
+            f"and '{get_root_folder_id()}' in parents"
+        ),
+        spaces='drive',
+        fields='files(id,name)'
+    ).execute()
+    files = resp.get('files', [])
+    if files:
+        return files[0]['id']
+    folder_metadata = {
+        'name': subfolder_name,
+        'mimeType': 'application/vnd.google-apps.folder',
+        'parents': [get_root_folder_id()]
+    }
+    created = get_service().files().create(body=folder_metadata, fields='id').execute()
+    logger.info(f"Created subfolder: {subfolder_name}")
+    return created['id']
+
+
+def upload_word_file_to_folder(filename: str, content: bytes, subfolder_id: str) -> tuple[str, str]:
+    try:
         file_metadata = {
-            'name': os.path.basename(file_path),
+            'name': filename,
             'parents': [subfolder_id]
         }
-        media = MediaFileUpload(
-            file_path,
+        media = MediaIoBaseUpload(
+            io.BytesIO(content),
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         )
-        file = sa.files().create(
+        file = get_service().files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink'
         ).execute()
         file_id = file.get('id')
         file_url = file.get('webViewLink')
-        logger.info(f"Uploaded word file '{file_path}' to Google Drive: {file_url}")
+        logger.info(f"Uploaded word file '{filename}' to Google Drive: {file_url}")
         return file_id, file_url
     except Exception as e:
-        logger.error(f"Error uploading word file '{file_path}': {e}", exc_info=True)
-        raise Exception(f"Error uploading word file '{file_path}': {e}")
+        logger.error(f"Error uploading word file '{filename}': {e}", exc_info=True)
+        raise Exception(f"Error uploading word file '{filename}': {e}") from e
 
 
-def upload_excel_file_to_folder(file_path: str) -> tuple[str, str]:
+def upload_excel_file_to_folder(filename: str, content: bytes) -> tuple[str, str]:
     try:
         file_metadata = {
-            'name': os.path.basename(file_path),
-            'parents': [folder_id],
+            'name': filename,
+            'parents': [get_root_folder_id()],
             'mimeType': 'application/vnd.google-apps.spreadsheet',
             'properties': {
                 'locale': 'ru_RU'
             }
         }
-        media = MediaFileUpload(
-            file_path,
+        media = MediaIoBaseUpload(
+            io.BytesIO(content),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        file = sa.files().create(
+        file = get_service().files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink'
         ).execute()
         file_id = file.get('id')
         file_url = file.get('webViewLink')
-        logger.info(f"Uploaded excel '{file_path}' to Google Drive: {file_url}")
+        logger.info(f"Uploaded excel '{filename}' to Google Drive: {file_url}")
         return file_id, file_url
     except Exception as e:
-        logger.error(f"Error of uploading excel '{file_path}': {e}", exc_info=True)
-        raise Exception(f"Error of uploading excel '{file_path}': {str(e)}")
+        logger.error(f"Error of uploading excel '{filename}': {e}", exc_info=True)
+        raise Exception(f"Error of uploading excel '{filename}': {str(e)}") from e
 
 
-def overwrite_excel_file_by_id(file_id: str, file_path: str):
+def overwrite_excel_file_by_id(file_id: str, filename: str, content: bytes):
     try:
-        media = MediaFileUpload(
-            file_path,
+        media = MediaIoBaseUpload(
+            io.BytesIO(content),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        file = sa.files().update(
+        file = get_service().files().update(
             fileId=file_id,
             media_body=media,
             fields='id, webViewLink'
         ).execute()
         file_id = file.get('id')
         file_url = file.get('webViewLink')
-        logger.info(f"Overwrote excel '{file_path}' in Google Drive: {file_url}")
+        logger.info(f"Overwrote excel '{filename}' in Google Drive: {file_url}")
         return file_id, file_url
     except Exception as e:
-        logger.error(f"Error of overwriting excel '{file_path}': {e}", exc_info=True)
-        raise Exception(f"Error of overwriting excel '{file_path}': {str(e)}")
+        logger.error(f"Error of overwriting excel '{filename}': {e}", exc_info=True)
+        raise Exception(f"Error of overwriting excel '{filename}': {str(e)}") from e
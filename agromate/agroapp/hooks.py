@@ -1,9 +1,14 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
+import bot_client
+from config import settings
 from database import init_db, load_dicts
+from dictionaries import load_dictionary_snapshot
+from jobs import recover_orphaned_jobs, run_job_worker, stop_job_worker
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +16,19 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def life_hook(app: FastAPI):
     logger.info('Startup hook')
+    await bot_client.open_session()
     await init_db()
     await load_dicts()
+    await load_dictionary_snapshot()
+    worker = None
+    if settings.job_worker_enabled:
+        await recover_orphaned_jobs()
+        worker = asyncio.create_task(run_job_worker())
     yield
     logger.info('Shutdown hook')
+    if worker:
+        worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await worker
+        await stop_job_worker()
+    await bot_client.close_session()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from sqlalchemy import update, or_, func, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from bg import run_safe
+from config import settings
+from database import async_session, async_engine
+from entities import ChatMessage
+from models import MessageStatus
+from dictionaries import get_dictionaries
+from dump import resume_report_dumps
+from duplicates import OriginalPendingError
+from processors import process_message, process_report, notify_failed
+
+logger = logging.getLogger(__name__)
+
+# Статусы сообщений, которые ждут обработки воркером:
+# new - определение типа сообщения, processing - разбор отчета
+PENDING_STATUSES = (MessageStatus.new, MessageStatus.processing)
+# Канал Postgres LISTEN/NOTIFY для пробуждения воркеров в других процессах
+JOBS_CHANNEL = "chat_message_jobs"
+
+_wakeup = asyncio.Event()
+_running: set[asyncio.Task] = set()
+
+
+def wake_up_workers():
+    _wakeup.set()
+
+
+async def notify_workers(session: AsyncSession):
+    # NOTIFY доставляется слушателям только после коммита транзакции
+    await session.execute(text(f"NOTIFY {JOBS_CHANNEL}"))
+
+
+async def claim_jobs(limit: int) -> list[tuple[int, MessageStatus]]:
+    now = func.now()
+    candidates = (
+        select(ChatMessage.id)
+        .where(ChatMessage.status.in_(PENDING_STATUSES))
+        .where(or_(ChatMessage.available_at.is_(None), ChatMessage.available_at <= now))
+        .where(or_(ChatMessage.locked_until.is_(None), ChatMessage.locked_until < now))
+        .order_by(ChatMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session() as session:
+        rows = (await session.execute(
+            update(ChatMessage)
+            .where(ChatMessage.id.in_(candidates))
+            .values(
+                locked_until=now + timedelta(seconds=settings.job_lease_seconds),
+                locked_by=settings.worker_id,
+                attempts=ChatMessage.attempts + 1,
+            )
+            .returning(ChatMessage.id, ChatMessage.status)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await session.commit()
+    return [(row.id, row.status) for row in rows]
+
+
+async def reschedule_job(chat_message_id: int, error: str):
+    async with async_session() as session:
+        chat_message: ChatMessage = (await session.exec(
+            select(ChatMessage).where(ChatMessage.id == chat_message_id)
+        )).one_or_none()
+        if chat_message is None or chat_message.status not in PENDING_STATUSES:
+            return
+        if chat_message.attempts >= settings.job_max_attempts:
+            chat_message.status = MessageStatus.failed
+            chat_message.status_text = error
+            logger.error(f"Job {chat_message_id} failed after {chat_message.attempts} attempts: {error}")
+        else:
+            delay = settings.job_retry_backoff_seconds * 2 ** max(chat_message.attempts - 1, 0)
+            await session.execute(
+                update(ChatMessage)
+                .where(ChatMessage.id == chat_message_id)
+                .values(available_at=func.now() + timedelta(seconds=delay), locked_until=None, locked_by=None)
+                .execution_options(synchronize_session=False)
+            )
+            logger.warning(f"Job {chat_message_id} will be retried in {delay}s: {error}")
+        await session.commit()
+    if chat_message.status == MessageStatus.failed:
+        await notify_failed(chat_message)
+
+
+async def defer_job(chat_message_id: int, delay: float):
+    """Откладывает задачу, не засчитывая попытку (например, пока обрабатывается оригинал копии)"""
+    async with async_session() as session:
+        await session.execute(
+            update(ChatMessage)
+            .where(ChatMessage.id == chat_message_id)
+            .values(
+                available_at=func.now() + timedelta(seconds=delay),
+                locked_until=None,
+                locked_by=None,
+                attempts=func.greatest(ChatMessage.attempts - 1, 0),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+async def release_own_jobs(refund_attempt: bool) -> int:
+    """
+    Снимает аренды незавершенных задач этого процесса (settings.worker_id), чтобы их сразу взял любой воркер.
+
+    Args:
+        refund_attempt: не засчитывать прерванную попытку (остановка процесса). После падения попытка
+            засчитывается: сообщение, которое роняет процесс, не должно обрабатываться бесконечно
+    """
+    values = dict(locked_until=None, locked_by=None)
+    if refund_attempt:
+        values["attempts"] = func.greatest(ChatMessage.attempts - 1, 0)
+    async with async_session() as session:
+        result = await session.execute(
+            update(ChatMessage)
+            .where(ChatMessage.status.in_(PENDING_STATUSES))
+            .where(ChatMessage.locked_by == settings.worker_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def recover_orphaned_jobs() -> int:
+    """Снимает аренды, оставшиеся за этим процессом после падения, не дожидаясь их истечения"""
+    recovered = await release_own_jobs(refund_attempt=False)
+    logger.info(f"Recovered orphaned jobs of worker {settings.worker_id}: {recovered}")
+    return recovered
+
+
+async def stop_job_worker():
+    """Отменяет выполняемые задачи и возвращает их в очередь, чтобы остановка не задерживала сообщения"""
+    tasks = list(_running)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        released = await release_own_jobs(refund_attempt=True)
+        logger.info(f"Job worker stopped, {len(tasks)} running jobs cancelled, {released} leases released")
+    except Exception as e:
+        logger.error(f"Error of releasing job leases: {e}", exc_info=True)
+
+
+async def run_job(chat_message_id: int, status: MessageStatus):
+    handler = process_message if status == MessageStatus.new else process_report
+    try:
+        # Обработка не должна пережить аренду, иначе сообщение заберет другой воркер
+        await asyncio.wait_for(handler(chat_message_id), timeout=settings.job_lease_seconds)
+    except OriginalPendingError as e:
+        logger.info(f"Job {chat_message_id} deferred: {e}")
+        await defer_job(chat_message_id, settings.job_retry_backoff_seconds)
+    except Exception as e:
+        logger.error(f"Job {handler.__name__}({chat_message_id}) failed: {e}", exc_info=True)
+        await reschedule_job(chat_message_id, str(e) or type(e).__name__)
+
+
+def _on_jobs_notification(*args):
+    wake_up_workers()
+
+
+def _on_job_done(task: asyncio.Task):
+    _running.discard(task)
+    _wakeup.set()
+
+
+async def run_job_worker():
+    logger.info(f"Job worker started with concurrency {settings.job_concurrency}")
+    # Снимок справочников нужен предфильтру; в процессе API он уже загружен при старте
+    await get_dictionaries()
+    if settings.google_drive_folder_dumped:
+        await resume_report_dumps()
+    async with async_engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        listener = raw_conn.driver_connection
+        await listener.add_listener(JOBS_CHANNEL, _on_jobs_notification)
+        try:
+            await _poll_jobs()
+        finally:
+            await listener.remove_listener(JOBS_CHANNEL, _on_jobs_notification)
+
+
+async def _poll_jobs():
+    while True:
+        _wakeup.clear()
+        free_slots = settings.job_concurrency - len(_running)
+        jobs = []
+        if free_slots > 0:
+            try:
+                jobs = await claim_jobs(free_slots)
+            except Exception as e:
+                logger.error(f"Error of claiming jobs: {e}", exc_info=True)
+        for chat_message_id, status in jobs:
+            task = asyncio.create_task(run_safe(run_job, chat_message_id, status))
+            _running.add(task)
+            task.add_done_callback(_on_job_done)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.job_poll_interval)
+        except asyncio.TimeoutError:
+            pass
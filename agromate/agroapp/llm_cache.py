@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Any
+
+from langchain_core.messages import BaseMessage, AIMessage
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+
+from config import settings
+from database import async_session
+from entities import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Вытеснение запускается раз в столько записей в кэш, а не на каждую
+EVICTION_INTERVAL = 100
+
+stats = Counter()
+
+
+@lru_cache(maxsize=128)
+def _schema_hash(schema: type[BaseModel]) -> str:
+    return hashlib.sha256(json.dumps(schema.model_json_schema(), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(model: ChatOpenAI, messages: list[BaseMessage], schema: Optional[type[BaseModel]]) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps([model.model_name, model.temperature]).encode("utf-8"))
+    for message in messages:
+        digest.update(f"\x1e{message.type}\x1f{message.content}".encode("utf-8"))
+    digest.update(b"\x1e")
+    digest.update(_schema_hash(schema).encode("utf-8") if schema else b"text")
+    return digest.hexdigest()
+
+
+def _serialize(result: Any, schema: Optional[type[BaseModel]]) -> str:
+    return result.model_dump_json() if schema else result.content
+
+
+def _deserialize(response: str, schema: Optional[type[BaseModel]]) -> Any:
+    return schema.model_validate_json(response) if schema else AIMessage(content=response)
+
+
+async def _lookup(key: str) -> Optional[str]:
+    async with async_session() as session:
+        entry: LLMCacheEntry = (await session.exec(
+            select(LLMCacheEntry)
+            .where(LLMCacheEntry.key == key)
+            .where(LLMCacheEntry.created_at >= datetime.now() - timedelta(hours=settings.llm_cache_ttl_hours))
+        )).one_or_none()
+        if entry is None:
+            return None
+        await session.execute(
+            update(LLMCacheEntry)
+            .where(LLMCacheEntry.key == key)
+            .values(accessed_at=datetime.now(), hits=LLMCacheEntry.hits + 1)
+        )
+        await session.commit()
+        return entry.response
+
+
+async def _store(key: str, model_name: str, response: str):
+    now = datetime.now()
+    async with async_session() as session:
+        await session.execute(
+            insert(LLMCacheEntry)
+            .values(key=key, model_name=model_name, response=response, created_at=now, accessed_at=now, hits=0)
+            .on_conflict_do_update(
+                index_elements=[LLMCacheEntry.key],
+                set_=dict(response=response, created_at=now, accessed_at=now),
+            )
+        )
+        await session.commit()
+
+
+async def evict():
+    """Удаляет просроченные записи и самые давно использованные сверх llm_cache_max_entries"""
+    async with async_session() as session:
+        expired = await session.execute(
+            delete(LLMCacheEntry)
+            .where(LLMCacheEntry.created_at < datetime.now() - timedelta(hours=settings.llm_cache_ttl_hours))
+        )
+        keep = (
+            select(LLMCacheEntry.key)
+            .order_by(LLMCacheEntry.accessed_at.desc())
+            .limit(settings.llm_cache_max_entries)
+        )
+        overflow = await session.execute(
+            delete(LLMCacheEntry).where(LLMCacheEntry.key.not_in(keep))
+        )
+        await session.commit()
+    stats["evictions"] += expired.rowcount + overflow.rowcount
+    logger.info(f"LLM cache eviction: {expired.rowcount} expired, {overflow.rowcount} least recently used")
+
+
+async def cached_ainvoke(
+        model: ChatOpenAI,
+        messages: list[BaseMessage],
+        schema: Optional[type[BaseModel]] = None,
+        runnable=None,
+) -> Any:
+    """
+    Вызывает LLM через кэш ответов в Postgres.
+
+    Args:
+        model: модель, ее имя и температура входят в ключ кэша
+        messages: сообщения запроса
+        schema: схема структурированного ответа (None - текстовый ответ)
+        runnable: готовая модель со структурированным выводом, по умолчанию строится из model и schema
+    """
+    if runnable is None:
+        runnable = model.with_structured_output(schema) if schema else model
+    if not settings.llm_cache_enabled:
+        return await runnable.ainvoke(messages)
+
+    key = cache_key(model, messages, schema)
+    try:
+        response = await _lookup(key)
+    except Exception as e:
+        # Кэш не должен ломать обработку, при его недоступности идем в LLM
+        logger.warning(f"LLM cache lookup failed: {e}")
+        response = None
+    if response is not None:
+        stats["hits"] += 1
+        logger.info(f"LLM cache hit {key[:12]} (hits {stats['hits']}, misses {stats['misses']})")
+        return _deserialize(response, schema)
+
+    stats["misses"] += 1
+    result = await runnable.ainvoke(messages)
+    try:
+        await _store(key, model.model_name, _serialize(result, schema))
+        stats["stores"] += 1
+        if stats["stores"] % EVICTION_INTERVAL == 0:
+            await evict()
+    except Exception as e:
+        logger.warning(f"LLM cache store failed: {e}")
+    return result
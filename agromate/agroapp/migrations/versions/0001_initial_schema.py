@@ -0,0 +1,83 @@
+"""Исходная схема: сообщения, справочники и отчеты
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-06-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+MESSAGE_STATUS = sa.Enum("new", "spam", "processing", "processed", "failed", name="messagestatus")
+
+
+def upgrade():
+    op.create_table(
+        "chat_message",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("serial_num", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=False),
+        sa.Column("chat_id", sa.String(), nullable=False),
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("message_text", sa.String(), nullable=False),
+        sa.Column("status", MESSAGE_STATUS, nullable=False),
+        sa.Column("status_text", sa.String(), nullable=True),
+    )
+    op.create_table(
+        "department",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("subdivision", sa.String(), nullable=False),
+        sa.Column("production_unit", sa.String(), nullable=False),
+        sa.Column("department_number", sa.String(), nullable=False),
+        sa.Column("aliases", sa.String(), nullable=True),
+    )
+    op.create_index("ix_department_subdivision", "department", ["subdivision"])
+    op.create_table(
+        "operation",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("operation_name", sa.String(), nullable=False),
+        sa.Column("note", sa.String(), nullable=True),
+        sa.Column("aliases", sa.String(), nullable=True),
+    )
+    op.create_table(
+        "crop",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("crop_name", sa.String(), nullable=False),
+        sa.Column("aliases", sa.String(), nullable=True),
+    )
+    op.create_table(
+        "report",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("worked_on", sa.Date(), nullable=False),
+        sa.Column("chat_message_id", sa.Integer(), sa.ForeignKey("chat_message.id"), nullable=False),
+        sa.Column("department_id", sa.Integer(), sa.ForeignKey("department.id"), nullable=True),
+        sa.Column("operation_id", sa.Integer(), sa.ForeignKey("operation.id"), nullable=True),
+        sa.Column("crop_id", sa.Integer(), sa.ForeignKey("crop.id"), nullable=True),
+        sa.Column("department_raw", sa.String(), nullable=True),
+        sa.Column("operation_raw", sa.String(), nullable=True),
+        sa.Column("crop_raw", sa.String(), nullable=True),
+        sa.Column("department_predicted", sa.String(), nullable=True),
+        sa.Column("operation_predicted", sa.String(), nullable=True),
+        sa.Column("crop_predicted", sa.String(), nullable=True),
+        sa.Column("note", sa.String(), nullable=True),
+        sa.Column("day_area", sa.Float(), nullable=False),
+        sa.Column("cumulative_area", sa.Float(), nullable=True),
+        sa.Column("day_yield", sa.Float(), nullable=True),
+        sa.Column("cumulative_yield", sa.Float(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("report")
+    op.drop_table("crop")
+    op.drop_table("operation")
+    op.drop_index("ix_department_subdivision", table_name="department")
+    op.drop_table("department")
+    op.drop_table("chat_message")
+    MESSAGE_STATUS.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,168 @@
+"""Очередь обработки, дубликаты, кэш LLM, выгрузки и итоги отчетов за день
+
+Схема, которую до появления миграций создавал SQLModel.metadata.create_all.
+Базы, созданные create_all, могут уже содержать часть этих таблиц и колонок,
+поэтому миграция пропускает существующие объекты.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-10-01 00:00:00
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Триггеры увеличивают версию справочников при любом их изменении,
+# чтобы процессы приложения перечитали закэшированные справочники
+DICTIONARY_VERSION_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION bump_dictionary_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO dictionary_version (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO UPDATE SET version = dictionary_version.version + 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    *[
+        f"""
+        CREATE OR REPLACE TRIGGER {table}_dictionary_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_dictionary_version()
+        """
+        for table in ("department", "operation", "crop")
+    ],
+    "INSERT INTO dictionary_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+]
+
+
+def _has_table(name: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _add_columns(table: str, *columns: sa.Column):
+    existing = set()
+    if not context.is_offline_mode():
+        existing = {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+    for column in columns:
+        if column.name not in existing:
+            op.add_column(table, column)
+
+
+def upgrade():
+    _add_columns(
+        "chat_message",
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("available_at", sa.DateTime(), nullable=True),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.Column("content_hash", sa.String(), nullable=True),
+        sa.Column("simhash", sa.BigInteger(), nullable=True),
+        sa.Column("duplicate_of_id", sa.Integer(), sa.ForeignKey("chat_message.id"), nullable=True),
+        sa.Column("near_duplicate_of_id", sa.Integer(), sa.ForeignKey("chat_message.id"), nullable=True),
+    )
+    op.create_index("ix_chat_message_content_hash", "chat_message", ["content_hash"], if_not_exists=True)
+    _add_columns(
+        "report",
+        sa.Column("department_confidence", sa.Float(), nullable=True),
+        sa.Column("operation_confidence", sa.Float(), nullable=True),
+        sa.Column("crop_confidence", sa.Float(), nullable=True),
+    )
+
+    if not _has_table("dictionary_version"):
+        op.create_table(
+            "dictionary_version",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("version", sa.Integer(), nullable=False),
+        )
+    for ddl in DICTIONARY_VERSION_DDL:
+        op.execute(ddl)
+
+    if not _has_table("llm_cache"):
+        op.create_table(
+            "llm_cache",
+            sa.Column("key", sa.String(), primary_key=True),
+            sa.Column("model_name", sa.String(), nullable=False),
+            sa.Column("response", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("accessed_at", sa.DateTime(), nullable=False),
+            sa.Column("hits", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_llm_cache_accessed_at", "llm_cache", ["accessed_at"])
+
+    if not _has_table("report_dump"):
+        op.create_table(
+            "report_dump",
+            sa.Column("report_on", sa.Date(), primary_key=True),
+            sa.Column("file_id", sa.String(), nullable=True),
+            sa.Column("last_report_id", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+        )
+
+    if not _has_table("drive_folder"):
+        op.create_table(
+            "drive_folder",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("folder_id", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    if not _has_table("daily_report"):
+        op.create_table(
+            "daily_report",
+            sa.Column("report_on", sa.Date(), primary_key=True),
+            sa.Column("report_count", sa.Integer(), nullable=False),
+            sa.Column("problem_count", sa.Integer(), nullable=False),
+            sa.Column("last_report_id", sa.Integer(), nullable=False),
+            sa.Column("artifact_report_id", sa.Integer(), nullable=True),
+            sa.Column("artifact_report_count", sa.Integer(), nullable=True),
+            sa.Column("file_url", sa.String(), nullable=True),
+            sa.Column("summary", sa.String(), nullable=True),
+            sa.Column("generated_at", sa.DateTime(), nullable=True),
+        )
+
+    if not _has_table("daily_report_total"):
+        op.create_table(
+            "daily_report_total",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("report_on", sa.Date(), nullable=False),
+            sa.Column("department_id", sa.Integer(), sa.ForeignKey("department.id"), nullable=True),
+            sa.Column("operation_id", sa.Integer(), sa.ForeignKey("operation.id"), nullable=True),
+            sa.Column("crop_id", sa.Integer(), sa.ForeignKey("crop.id"), nullable=True),
+            sa.Column("report_count", sa.Integer(), nullable=False),
+            sa.Column("problem_count", sa.Integer(), nullable=False),
+            sa.Column("day_area", sa.Float(), nullable=False),
+            sa.Column("day_yield", sa.Float(), nullable=False),
+        )
+        op.create_index(
+            "ix_daily_report_total_key",
+            "daily_report_total",
+            ["report_on", "department_id", "operation_id", "crop_id"],
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        )
+
+
+def downgrade():
+    op.drop_table("daily_report_total")
+    op.drop_table("daily_report")
+    op.drop_table("drive_folder")
+    op.drop_table("report_dump")
+    op.drop_table("llm_cache")
+    for table in ("department", "operation", "crop"):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_dictionary_version ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_dictionary_version()")
+    op.drop_table("dictionary_version")
+    for column in ("department_confidence", "operation_confidence", "crop_confidence"):
+        op.drop_column("report", column)
+    op.drop_index("ix_chat_message_content_hash", table_name="chat_message")
+    for column in (
+            "near_duplicate_of_id", "duplicate_of_id", "simhash", "content_hash",
+            "locked_until", "available_at", "attempts",
+    ):
+        op.drop_column("chat_message", column)
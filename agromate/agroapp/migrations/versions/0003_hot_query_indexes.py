@@ -0,0 +1,43 @@
+"""Индексы для частых запросов
+
+- report(worked_on): отчеты за день (/api/reports, выгрузка, итоги дня)
+- report(chat_message_id): связь отчетов с сообщением
+- chat_message(user_id, serial_num): следующий порядковый номер сообщения пользователя
+- chat_message(created_at): окно поиска дубликатов
+- chat_message(id) WHERE status IN ('new', 'processing'): выбор задач воркером
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-10-20 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_report_worked_on", "report", ["worked_on"], if_not_exists=True)
+    op.create_index("ix_report_chat_message_id", "report", ["chat_message_id"], if_not_exists=True)
+    op.create_index(
+        "ix_chat_message_user_id_serial_num", "chat_message", ["user_id", "serial_num"], if_not_exists=True,
+    )
+    op.create_index("ix_chat_message_created_at", "chat_message", ["created_at"], if_not_exists=True)
+    op.create_index(
+        "ix_chat_message_pending",
+        "chat_message",
+        ["id"],
+        postgresql_where=sa.text("status IN ('new', 'processing')"),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_chat_message_pending", table_name="chat_message")
+    op.drop_index("ix_chat_message_created_at", table_name="chat_message")
+    op.drop_index("ix_chat_message_user_id_serial_num", table_name="chat_message")
+    op.drop_index("ix_report_chat_message_id", table_name="report")
+    op.drop_index("ix_report_worked_on", table_name="report")
@@ -0,0 +1,32 @@
+"""Счетчик порядковых номеров сообщений пользователей
+
+Заменяет advisory-блокировку по hash(user_id) и MAX(serial_num) при каждой вставке.
+Счетчики заполняются текущими максимальными номерами.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-10-22 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_serial_counter",
+        sa.Column("user_id", sa.String(), primary_key=True),
+        sa.Column("last_serial", sa.Integer(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO user_serial_counter (user_id, last_serial) "
+        "SELECT user_id, MAX(serial_num) FROM chat_message GROUP BY user_id"
+    )
+
+
+def downgrade():
+    op.drop_table("user_serial_counter")
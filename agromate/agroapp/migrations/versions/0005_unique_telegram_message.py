@@ -0,0 +1,34 @@
+"""Уникальность сообщения Telegram (chat_id, message_id)
+
+Уже сохраненные повторы получают message_id с суффиксом "#<id>": записи и их отчеты
+остаются, но больше не мешают ограничению.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-10-24 00:00:00
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        UPDATE chat_message AS m
+        SET message_id = m.message_id || '#' || m.id
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id, message_id ORDER BY id) AS rn
+            FROM chat_message
+        ) AS d
+        WHERE d.id = m.id AND d.rn > 1
+        """
+    )
+    op.create_unique_constraint("uq_chat_message_chat_id_message_id", "chat_message", ["chat_id", "message_id"])
+
+
+def downgrade():
+    op.drop_constraint("uq_chat_message_chat_id_message_id", "chat_message", type_="unique")
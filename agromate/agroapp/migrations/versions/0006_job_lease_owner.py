@@ -0,0 +1,23 @@
+"""Владелец аренды задачи (chat_message.locked_by)
+
+Процесс снимает свои аренды при остановке и после перезапуска, не дожидаясь их истечения.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-10-26 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("chat_message", sa.Column("locked_by", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("chat_message", "locked_by")
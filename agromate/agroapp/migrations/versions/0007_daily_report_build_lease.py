@@ -0,0 +1,26 @@
+"""Аренда сборки отчета за день (daily_report.build_locked_until, build_locked_by)
+
+Сборка отчета за день больше не держит соединение и advisory-блокировку на время построения файла,
+загрузки и запроса к LLM: между репликами ее выполняет владелец аренды.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-10-27 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("daily_report", sa.Column("build_locked_until", sa.DateTime(), nullable=True))
+    op.add_column("daily_report", sa.Column("build_locked_by", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("daily_report", "build_locked_by")
+    op.drop_column("daily_report", "build_locked_until")
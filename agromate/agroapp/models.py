@@ -28,6 +28,8 @@ class ChatMessageCreateRequest(BaseModel):
 
 class ChatMessageCreateResponse(BaseModel):
     id: int
+    # Сообщение уже было сохранено раньше (повторная доставка), новая обработка не запускалась
+    duplicate: bool = False
 
 
 class ChatMessageReactionRequest(BaseModel):
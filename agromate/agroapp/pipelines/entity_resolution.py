@@ -0,0 +1,100 @@
+import logging
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Optional
+
+from config import settings
+
+from .utils import EntityIndex, normalize_key
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+# Сколько кандидатов по n-граммам перепроверяется редакционным расстоянием
+CANDIDATES_LIMIT = 10
+# Лучший кандидат должен опережать ближайшую другую сущность хотя бы на столько
+MIN_MARGIN = 0.05
+# Короткие ключи и номера (например, отделения "18" и "19") сопоставляются только точно
+MIN_KEY_LENGTH = 4
+
+
+def _ngrams(key: str) -> set[str]:
+    padded = f" {key} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def _is_fuzzy_key(key: str) -> bool:
+    return len(key) >= MIN_KEY_LENGTH and not key.replace(" ", "").isdigit()
+
+
+class FuzzyMatcher:
+    """
+    Локальное сопоставление значений, не найденных в справочнике, с названиями и алиасами:
+    кандидаты отбираются по общим символьным n-граммам, затем уточняются через SequenceMatcher.
+    Строится один раз на снимок справочников.
+    """
+
+    def __init__(self, index: EntityIndex):
+        self.index = index
+        self.ngrams = {key: _ngrams(key) for key in index.ids if _is_fuzzy_key(key)}
+        self.postings: dict[str, list[str]] = {}
+        for key, grams in self.ngrams.items():
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(key)
+
+    def resolve(self, value: str) -> tuple[Optional[int], Optional[str], float]:
+        """
+        Returns:
+            ID сущности, ее название и уверенность (0..1); ID и название пустые,
+            если уверенного совпадения нет
+        """
+        key = normalize_key(value)
+        if key in self.index.ids:
+            return self.index.ids[key], self.index.labels[key], 1.0
+        if not _is_fuzzy_key(key):
+            return None, None, 0.0
+
+        grams = _ngrams(key)
+        shared = Counter(k for gram in grams for k in self.postings.get(gram, ()))
+        scored = []
+        for candidate, common in shared.most_common(CANDIDATES_LIMIT):
+            dice = 2 * common / (len(grams) + len(self.ngrams[candidate]))
+            ratio = SequenceMatcher(None, key, candidate).ratio()
+            scored.append(((dice + ratio) / 2, candidate))
+        if not scored:
+            return None, None, 0.0
+        scored.sort(reverse=True)
+
+        score, best = scored[0]
+        best_id = self.index.ids[best]
+        runner_up = next((s for s, k in scored[1:] if self.index.ids[k] != best_id), 0.0)
+        if score < settings.entity_match_threshold or score - runner_up < MIN_MARGIN:
+            logger.info(f"   🔎 Нет уверенного совпадения для '{value}': '{self.index.labels[best]}' ({score:.2f})")
+            return None, None, score
+        return best_id, self.index.labels[best], score
+
+
+def resolve_unmatched(
+        matcher: FuzzyMatcher,
+        entity_id: Optional[int],
+        raw_value: Optional[str],
+        explanations: list[str],
+        field_name: str,
+) -> tuple[Optional[int], Optional[float]]:
+    """
+    Пытается сопоставить нераспознанное (raw) значение поля отчета со справочником.
+    Значения со статусом predict LLM уже выбрала из справочника, их проверяет человек.
+
+    Returns:
+        ID сущности и уверенность сопоставления (1.0 для точного совпадения)
+    """
+    if entity_id is not None:
+        return entity_id, 1.0
+    if not raw_value:
+        return None, None
+    resolved_id, label, score = matcher.resolve(raw_value)
+    if resolved_id is None:
+        return None, None
+    logger.info(f"   🔎 '{raw_value}' сопоставлено локально с '{label}' (ID: {resolved_id}, уверенность {score:.2f})")
+    explanations.append(f"{field_name}: '{raw_value}' автоматически сопоставлено с '{label}' (уверенность {score:.2f})")
+    return resolved_id, score
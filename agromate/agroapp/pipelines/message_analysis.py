@@ -0,0 +1,117 @@
+import logging
+import time
+from datetime import datetime
+from typing import Literal
+
+from jinja2 import Template
+from langchain_core.messages import SystemMessage
+from pydantic import Field, create_model
+
+from dictionaries import DictionarySnapshot
+from entities import Report
+from llm_cache import cached_ainvoke
+from models import MessageType
+
+from .message_definition import spam_filter_few_shot_examples_str
+from .report_solution import (
+    model,
+    llm_config,
+    prompts_config,
+    create_extraction_schema,
+    render_extraction_prompt,
+    entries_to_reports,
+)
+from .utils import (
+    split_prompt,
+    DictionaryVersionCache,
+    MESSAGE_PLACEHOLDER,
+)
+
+logger = logging.getLogger(__name__)
+
+# Шаблон объединенного промпта: классификация + разбор отчета за один запрос
+COMBINED_SYSTEM_PROMPT_TEMPLATE = Template(prompts_config.get("combined_system_prompt_template"))
+
+# Схема, модель со структурированным выводом и промпт для текущих справочников
+_analysis_cache = DictionaryVersionCache("analysis")
+
+
+def create_message_analysis_schema(field_work_log_schema):
+    """
+    Расширяет схему FieldWorkLog полями классификации из MessageClassification,
+    чтобы модель вернула и тип сообщения, и записи отчета в одном ответе.
+    """
+    return create_model(
+        "MessageAnalysis",
+        explanation=(str, Field(
+            ...,
+            description="Short explanation in Russian why the message should or should not be processed."
+        )),
+        message_type=(Literal["field_report", "non_report"], Field(
+            ...,
+            description="Message classification result: 'field_report' — if it's a pure fieldwork report, 'non_report' — if it's a question, discussion, planning, or irrelevant content."
+        )),
+        entries=(field_work_log_schema.model_fields["entries"].annotation, Field(
+            ...,
+            description="Список записей о полевых операциях; пустой список, если сообщение не является отчетом"
+        )),
+    )
+
+
+def get_analysis_pipeline(dictionaries: DictionarySnapshot):
+    def build():
+        schema = create_message_analysis_schema(create_extraction_schema(
+            dictionaries.department_names,
+            dictionaries.operation_names,
+            dictionaries.crop_names,
+        ))
+        prompt = split_prompt(COMBINED_SYSTEM_PROMPT_TEMPLATE.render(
+            spam_filter_few_shot_examples=spam_filter_few_shot_examples_str,
+            extraction_prompt=render_extraction_prompt(schema.model_json_schema(), MESSAGE_PLACEHOLDER),
+        ))
+        return schema, model.with_structured_output(schema), prompt
+
+    return _analysis_cache.get(dictionaries.names_hash, build)
+
+
+async def analyze_message(
+        message_id: int,
+        message_text: str,
+        message_created_at: datetime,
+        dictionaries: DictionarySnapshot,
+) -> tuple[MessageType, list[Report]]:
+    """
+    Определяет тип сообщения и извлекает из него отчеты одним запросом к LLM
+
+    Returns:
+        Тип сообщения и список отчетов (пустой для спама)
+    """
+    start_time = time.time()
+    logger.info(f"⏳ Объединенный разбор сообщения ID: {message_id}")
+
+    schema, structured_model, prompt = get_analysis_pipeline(dictionaries)
+    system_prompt = prompt.render(message_text)
+
+    logger.info(f"🧠 Отправка запроса к модели {llm_config.get('llm_model_name')}")
+    analysis = await cached_ainvoke(
+        model,
+        [SystemMessage(content=system_prompt)],
+        schema,
+        structured_model,
+    )
+    logger.info(
+        f"✅ Результат: {analysis.message_type}, записей: {len(analysis.entries)} "
+        f"[время: {time.time() - start_time:.2f}с]"
+    )
+    logger.info(f"Объяснение: {analysis.explanation}")
+
+    if analysis.message_type != "field_report":
+        return MessageType.spam, []
+
+    reports = entries_to_reports(
+        analysis.entries,
+        message_id,
+        message_created_at,
+        dictionaries,
+    )
+    return MessageType.report, reports
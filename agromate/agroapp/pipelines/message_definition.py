@@ -2,16 +2,20 @@ import logging
 import os
 import time
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 
 import yaml
 from config import settings
 from jinja2 import Template
 from langchain_core.messages import SystemMessage
 from langchain_openai import ChatOpenAI
+from llm_cache import cached_ainvoke
 from models import MessageType
 from pydantic import BaseModel, Field
 
+from . import message_prefilter
+from .utils import split_prompt, MESSAGE_PLACEHOLDER
+
 logger = logging.getLogger(__name__)
 
 # Загрузка конфигурации LLM и промптов
@@ -44,6 +48,13 @@ class MessageClassification(BaseModel):
     )
 
 
+# Промпт не зависит от справочников, поэтому рендерится один раз при загрузке модуля
+SPAM_FILTER_PROMPT = split_prompt(SPAM_FILTER_SYSTEM_PROMPT_TEMPLATE.render(
+    json_schema=MessageClassification.model_json_schema(),
+    few_shot_examples=spam_filter_few_shot_examples_str,
+    message=MESSAGE_PLACEHOLDER,
+))
+
 # Инициализация модели
 model = ChatOpenAI(
     model=llm_config.get("llm_model_name"),
@@ -75,17 +86,15 @@ async def classify_message(
     
     start_time = time.time()
     
-    system_prompt = SPAM_FILTER_SYSTEM_PROMPT_TEMPLATE.render(
-        json_schema=MessageClassification.model_json_schema(),
-        few_shot_examples=spam_filter_few_shot_examples_str,
-        message=message,
-    )
+    system_prompt = SPAM_FILTER_PROMPT.render(message)
 
     logger.info(f"Отправка запроса к модели {llm_config.get('llm_model_name')}")
     
     try:
-        answer = await model.with_structured_output(MessageClassification).ainvoke(
-            [SystemMessage(content=system_prompt)]
+        answer = await cached_ainvoke(
+            model,
+            [SystemMessage(content=system_prompt)],
+            MessageClassification,
         )
         
         # Логирование результата классификации
@@ -100,6 +109,18 @@ async def classify_message(
         raise
 
 
+def prefilter_message_type(text: str) -> Optional[MessageType]:
+    """
+    Определяет тип сообщения правилами без обращения к LLM
+
+    Returns:
+        MessageType для очевидных случаев или None, если решение за LLM
+    """
+    if settings.prefilter_enabled and message_prefilter.prefilter:
+        return message_prefilter.prefilter.classify(text)
+    return None
+
+
 async def define_message_type(text: str) -> MessageType:
     """
     Определяет тип сообщения: отчет, загрузка или спам
@@ -113,7 +134,12 @@ async def define_message_type(text: str) -> MessageType:
     # Логирование вызова функции
     message_len = len(text)
     logger.info(f"Определение типа сообщения длиной {message_len} символов")
-    
+
+    # Очевидные случаи решаются правилами без обращения к LLM
+    message_type = prefilter_message_type(text)
+    if message_type:
+        return message_type
+
     try:
         # Классификация сообщения через LLM
         result = await classify_message(text, model)
@@ -0,0 +1,153 @@
+import logging
+import re
+from collections import Counter
+from typing import Optional
+
+from entities import Department, Operation, Crop
+from models import MessageType
+
+from .utils import extract_department_names
+
+logger = logging.getLogger(__name__)
+
+# Длина префикса, по которой сравниваются слова (грубая замена стемминга:
+# "культ" / "культивация", "диск" / "дискование", "пахота" / "пахоты")
+STEM_LENGTH = 4
+
+DIGIT_PATTERN = re.compile(r"\d")
+WORD_PATTERN = re.compile(r"[а-яa-z]+")
+
+# Строки площадей вида "По ПУ 26/488", "ПУ Север 20/100", "Отд 12 26/221", "Отд10-45/216"
+AREA_VALUE = r"\d+(?:[.,]\d+)?\s*/\s*\d+(?:[.,]\d+)?(?:\s*га)?"
+AREA_LINE_PATTERN = re.compile(
+    r"(?P<head>.*?)\s*"
+    r"(?:по\s+)?(?:пу(?P<unit>(?:\s+[а-я]+)?)|отд[а-я]*\.?\s*-?\s*\d+)"
+    rf"\s*[-–:]?\s*{AREA_VALUE}"
+)
+# Дата отдельной строкой: "27.10", "20.11.2025"
+DATE_LINE_PATTERN = re.compile(r"\d{1,2}\.\d{1,2}(?:\.\d{2,4})?")
+# Порядковый номер операции: "2-е диск", "1 гербицидная обработка", "дискование 3-е"
+ORDINAL_PATTERN = re.compile(r"^\d+(?:-?[а-я]{1,2})?\s+|\s+\d+(?:-?[а-я]{1,2})?$")
+HEADER_CHARS_PATTERN = re.compile(r"[а-я\s+-]+")
+# Короткие слова, допустимые в заголовке операции ("пахота под оз ячмень", "диск под сах св")
+HEADER_SHORT_WORDS = {"по", "на", "оз", "св", "и", "под"}
+
+
+def normalize_text(text: str) -> str:
+    return text.replace("\xa0", " ").replace("ё", "е").replace("Ё", "е").lower()
+
+
+def _stems(text: str) -> set[str]:
+    return {word[:STEM_LENGTH] for word in WORD_PATTERN.findall(normalize_text(text)) if len(word) >= 3}
+
+
+class MessagePrefilter:
+    """
+    Детерминированный классификатор очевидных случаев перед LLM:
+    болтовня без чисел и терминов - спам, сообщение строгого вида отчета - отчет, все остальное решает LLM.
+
+    Строгий вид отчета: каждая непустая строка - заголовок из операций и культур справочника,
+    строка площади по ПУ или отделению (можно с операцией в начале) или дата, и нет никакого свободного текста.
+    Поправки, планы, отмены и уточнения всегда содержат свободный текст, поэтому попадают в LLM,
+    который при неоднозначности считает сообщение не отчетом.
+    """
+
+    def __init__(self, departments: list[Department], operations: list[Operation], crops: list[Crop]):
+        self.operation_stems = set()
+        for op in operations:
+            self.operation_stems |= _stems(op.operation_name)
+            if op.aliases:
+                self.operation_stems |= _stems(op.aliases)
+        self.crop_stems = set()
+        for crop in crops:
+            self.crop_stems |= _stems(crop.crop_name)
+            if crop.aliases:
+                self.crop_stems |= _stems(crop.aliases)
+        # Номера отделений совпадают с любыми числами, поэтому учитываем только названия
+        department_names = [name for name in extract_department_names(departments) if not name.isdigit()]
+        self.department_stems = _stems(" ".join(department_names))
+        # Названия ПУ в строках площадей ("ПУ Север 20/100") сравниваются целыми словами
+        self.unit_words = set(WORD_PATTERN.findall(normalize_text(" ".join(department_names))))
+        self.stats = Counter()
+
+    def classify(self, text: str) -> Optional[MessageType]:
+        normalized = normalize_text(text)
+        stems = _stems(normalized)
+        has_terms = bool(stems & (self.operation_stems | self.crop_stems | self.department_stems))
+
+        if not DIGIT_PATTERN.search(normalized) and not has_terms:
+            return self._decide(MessageType.spam)
+
+        if self._is_strict_report(normalized):
+            return self._decide(MessageType.report)
+
+        return self._decide(None)
+
+    def _is_strict_report(self, normalized: str) -> bool:
+        has_operation = False
+        has_area = False
+        for line in normalized.splitlines():
+            line = line.strip()
+            if not line or DATE_LINE_PATTERN.fullmatch(line):
+                continue
+            area = AREA_LINE_PATTERN.fullmatch(line)
+            if area is None:
+                if not self._is_header(line):
+                    return False
+                has_operation = True
+                continue
+            unit = (area.group("unit") or "").strip()
+            if unit and unit not in self.unit_words:
+                return False
+            head = area.group("head")
+            if head:
+                if not self._is_header(head):
+                    return False
+                has_operation = True
+            # Площадь без операции перед ней не к чему отнести
+            if not has_operation:
+                return False
+            has_area = True
+        return has_area
+
+    def _is_header(self, line: str) -> bool:
+        """Строка только из операций, культур и служебных слов, и хотя бы одна операция"""
+        line = ORDINAL_PATTERN.sub("", line).strip()
+        if not HEADER_CHARS_PATTERN.fullmatch(line):
+            return False
+        vocabulary = self.operation_stems | self.crop_stems
+        has_operation = False
+        for word in WORD_PATTERN.findall(line):
+            if word in HEADER_SHORT_WORDS:
+                continue
+            stem = word[:STEM_LENGTH]
+            if stem in self.operation_stems:
+                has_operation = True
+            elif stem not in vocabulary and not (
+                    # Сокращения: "сах" (сахарная), "кук" (кукуруза)
+                    len(word) == 3 and any(known.startswith(word) for known in self.crop_stems)
+            ):
+                return False
+        return has_operation
+
+    def _decide(self, message_type: Optional[MessageType]) -> Optional[MessageType]:
+        self.stats[message_type.value if message_type else "llm"] += 1
+        saved = self.stats[MessageType.spam.value] + self.stats[MessageType.report.value]
+        total = sum(self.stats.values())
+        logger.info(
+            f"Предфильтр: {message_type.value if message_type else 'передано в LLM'}; "
+            f"сэкономлено вызовов LLM: {saved} из {total}"
+        )
+        return message_type
+
+
+prefilter: Optional[MessagePrefilter] = None
+
+
+def configure_prefilter(departments: list[Department], operations: list[Operation], crops: list[Crop]):
+    global prefilter
+    prefilter = MessagePrefilter(departments, operations, crops)
+    logger.info(
+        f"Предфильтр сообщений настроен: операций {len(prefilter.operation_stems)}, "
+        f"культур {len(prefilter.crop_stems)}, подразделений {len(prefilter.department_stems)} основ"
+    )
@@ -8,6 +8,7 @@ from jinja2 import Template
 
 from config import settings
 from entities import Report
+from llm_cache import cached_ainvoke
 
 import yaml
 import os
@@ -86,8 +87,9 @@ async def summarize_reports(reports: list[Report]) -> str:
     # Отправляем запрос к модели
     logger.info(f"Отправка запроса к LLM модели {llm_config.get('llm_model_name')}")
     try:
-        response = await model.ainvoke(
-            [SystemMessage(content=system_prompt)]
+        response = await cached_ainvoke(
+            model,
+            [SystemMessage(content=system_prompt)],
         )
         
         # Добавляем статистику в начало ответа
@@ -1,7 +1,9 @@
+import hashlib
 import math
+from dataclasses import dataclass
 
 from pydantic import BaseModel, Field, field_validator
-from typing import Literal, Optional, Dict, Any, List, Tuple, Union
+from typing import Literal, Optional, Dict, Any, List, Tuple, Union, Callable, Iterable
 
 from datetime import datetime, date
 
@@ -13,26 +15,80 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def _match_department_id(name: str, departments: list[Department]) -> int:
-    for d in departments:
-        if (d.department_number == name or 
-            d.subdivision == name or 
-            d.production_unit == name or  # Добавлено: проверка поля production_unit
-            (d.aliases and name in d.aliases.split(","))):
-            return d.id
-    raise ValueError(f"Не найдено подразделение: {name}")
+# Значения-заглушки в справочнике подразделений, по ним сопоставлять нельзя
+DEPARTMENT_PLACEHOLDERS = ("Нет отделения", "Нет ПУ")
+
+
+def normalize_key(value: str) -> str:
+    """Ключ для сопоставления: без учета регистра, ё/е и лишних (в том числе неразрывных) пробелов"""
+    return " ".join(value.replace("\xa0", " ").casefold().replace("ё", "е").split())
+
+
+class EntityIndex:
+    """
+    Хеш-индекс нормализованных названий сущности справочника в ее ID.
+    Ключи, указывающие на несколько сущностей, выявляются при построении
+    и не сопоставляются, а возвращаются как ошибка со списком кандидатов.
+    """
+
+    def __init__(self, entity_name: str, not_found: str, keys: Iterable[Tuple[str, int]]):
+        self.entity_name = entity_name
+        self.not_found = not_found
+        candidates: Dict[str, set[int]] = {}
+        # Исходное написание ключа для сообщений пользователю
+        self.labels: Dict[str, str] = {}
+        for label, entity_id in keys:
+            key = normalize_key(label)
+            if key:
+                candidates.setdefault(key, set()).add(entity_id)
+                self.labels.setdefault(key, label.strip())
+        self.ids = {key: next(iter(ids)) for key, ids in candidates.items() if len(ids) == 1}
+        self.ambiguous = {key: tuple(sorted(ids)) for key, ids in candidates.items() if len(ids) > 1}
+        if self.ambiguous:
+            # Для подразделений это ожидаемо: ПУ и хозяйства объединяют несколько отделений
+            logger.info(
+                f"Неоднозначные ключи справочника '{entity_name}': "
+                + ", ".join(f"{key} -> {ids}" for key, ids in self.ambiguous.items())
+            )
+
+    def match(self, name: str) -> int:
+        key = normalize_key(name)
+        entity_id = self.ids.get(key)
+        if entity_id is not None:
+            return entity_id
+        if key in self.ambiguous:
+            raise ValueError(f"Неоднозначное значение '{name}' ({self.entity_name}), подходят ID: {self.ambiguous[key]}")
+        raise ValueError(f"{self.not_found}: {name}")
+
+
+def _split_aliases(aliases: Optional[str]) -> List[str]:
+    return aliases.split(",") if aliases else []
+
+
+def build_department_index(departments: List[Department]) -> EntityIndex:
+    return EntityIndex("подразделение", "Не найдено подразделение", (
+        (key, d.id)
+        for d in departments
+        for key in (d.department_number, d.subdivision, d.production_unit, *_split_aliases(d.aliases))
+        if key and key.strip() not in DEPARTMENT_PLACEHOLDERS
+    ))
+
+
+def build_operation_index(operations: List[Operation]) -> EntityIndex:
+    return EntityIndex("операция", "Не найдена операция", (
+        (key, o.id)
+        for o in operations
+        for key in (o.operation_name, *_split_aliases(o.aliases))
+    ))
+
+
+def build_crop_index(crops: List[Crop]) -> EntityIndex:
+    return EntityIndex("культура", "Не найдена культура", (
+        (key, c.id)
+        for c in crops
+        for key in (c.crop_name, *_split_aliases(c.aliases))
+    ))
 
-def _match_operation_id(name: str, operations: list[Operation]) -> int:
-    for o in operations:
-        if o.operation_name == name:
-            return o.id
-    raise ValueError(f"Не найдена операция: {name}")
-
-def _match_crop_id(name: str, crops: list[Crop]) -> int:
-    for c in crops:
-        if c.crop_name == name:
-            return c.id
-    raise ValueError(f"Не найдена культура: {name}")
 
 def extract_department_names(departments: List[Department]) -> Tuple[str, ...]:
     names = set()
@@ -60,6 +116,58 @@ def extract_department_names(departments: List[Department]) -> Tuple[str, ...]:
     return tuple(sorted(names))
 
 
+def dictionary_version(*names: Tuple[str, ...]) -> str:
+    """Хеш набора значений справочников, меняется при любом изменении справочников"""
+    digest = hashlib.sha256()
+    for group in names:
+        for name in group:
+            digest.update(name.encode("utf-8"))
+            digest.update(b"\x1f")
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+# Подставляется в шаблон вместо сообщения, чтобы отрендерить промпт один раз
+MESSAGE_PLACEHOLDER = "\x00MESSAGE\x00"
+
+
+@dataclass(frozen=True)
+class PromptParts:
+    """
+    Промпт, разделенный на статичный префикс и суффикс вокруг текста сообщения.
+    Префикс остается побайтово одинаковым между вызовами, что позволяет
+    провайдеру LLM кэшировать его.
+    """
+    prefix: str
+    suffix: str
+
+    def render(self, message: str) -> str:
+        return self.prefix + message + self.suffix
+
+
+def split_prompt(prompt: str) -> PromptParts:
+    prefix, suffix = prompt.split(MESSAGE_PLACEHOLDER, 1)
+    if MESSAGE_PLACEHOLDER in suffix:
+        raise ValueError("Сообщение должно встречаться в шаблоне промпта ровно один раз")
+    return PromptParts(prefix=prefix, suffix=suffix)
+
+
+class DictionaryVersionCache:
+    """Хранит значение, построенное по справочникам, до смены версии справочников"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.version: Optional[str] = None
+        self.value: Any = None
+
+    def get(self, version: str, factory: Callable[[], Any]) -> Any:
+        if self.version != version:
+            self.value = factory()
+            self.version = version
+            logger.info(f"🗂️ Кэш '{self.name}' перестроен для версии справочников {version[:12]}")
+        return self.value
+
+
 def is_empty(value):
     return value is None or (isinstance(value, float) and math.isnan(value))
 
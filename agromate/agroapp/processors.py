@@ -1,36 +1,89 @@
-import asyncio
 import logging
 
-from sqlalchemy.orm import selectinload
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from bg import run_safe
 from bot_client import send_reactions, reply_on_message
 from config import settings
+from daily_reports import add_to_daily_totals
 from database import async_session
-from dump import dump_message_silently, dump_report_silently
-from entities import ChatMessage, MessageStatus, Department, Operation, Crop, Report
+from duplicates import OriginalPendingError, find_exact_duplicate, find_near_duplicate
+from dump import dump_message_silently, schedule_report_dump
+from dictionaries import DictionarySnapshot, add_reload_listener, get_dictionaries
+from entities import ChatMessage, MessageStatus, Report
 from models import ChatMessageReactionRequest, MessageType, ChatMessageReplyRequest
-from pipelines.message_definition import define_message_type
-from pipelines.report_solution import solve_reports
+from pipelines.message_analysis import analyze_message
+from pipelines.message_definition import define_message_type, prefilter_message_type
+from pipelines.message_prefilter import configure_prefilter
+from pipelines.report_solution import solve_reports, COMBINED_MODE
 
 logger = logging.getLogger(__name__)
 
 
+def _on_dictionaries_reload(dictionaries: DictionarySnapshot):
+    configure_prefilter(dictionaries.departments, dictionaries.operations, dictionaries.crops)
+
+
+add_reload_listener(_on_dictionaries_reload)
+
+
+async def reuse_duplicate_result(session: AsyncSession, chat_message: ChatMessage) -> bool:
+    """
+    Для точной копии ранее обработанного сообщения переиспользует его результат без запросов к LLM.
+    Похожие, но не совпадающие сообщения только помечаются и обрабатываются как обычно.
+
+    Returns:
+        True, если статус сообщения взят у оригинала
+    """
+    original = await find_exact_duplicate(session, chat_message)
+    if original is None:
+        near_duplicate = await find_near_duplicate(session, chat_message)
+        if near_duplicate is not None:
+            chat_message.near_duplicate_of_id = near_duplicate.id
+            logger.info(f"Message {chat_message.id} is similar to message {near_duplicate.id}")
+        return False
+    if original.status in (MessageStatus.new, MessageStatus.processing):
+        raise OriginalPendingError(original.id)
+    chat_message.duplicate_of_id = original.id
+    chat_message.status = original.status
+    if original.status == MessageStatus.processed:
+        # Отчеты уже созданы по оригиналу, повторно их не создаем, чтобы не задвоить площади
+        chat_message.status_text = f"Копия сообщения {original.id}, отчеты не созданы повторно"
+    else:
+        chat_message.status_text = f"Копия сообщения {original.id}"
+    logger.info(f"Message {chat_message.id} is a duplicate of message {original.id} ({original.status.value})")
+    return True
+
+
 async def process_message(chat_message_id: int) -> None:
+    # Перечитывает справочники (и предфильтр), если они изменились
+    await get_dictionaries()
     async with async_session() as session:
         result = await session.exec(select(ChatMessage).where(ChatMessage.id == chat_message_id))
         chat_message: ChatMessage = result.one_or_none()
-        message_type = await define_message_type(chat_message.message_text)
+        if await reuse_duplicate_result(session, chat_message):
+            message_type = None
+        elif COMBINED_MODE:
+            # Тип сообщения определит объединенный запрос к LLM вместе с разбором отчета,
+            # здесь без LLM отсекается только очевидный спам
+            message_type = prefilter_message_type(chat_message.message_text) or MessageType.report
+        else:
+            # Соединение возвращается в пул на время запроса к LLM, кэш ответов берет свое
+            await session.commit()
+            message_type = await define_message_type(chat_message.message_text)
         if message_type == MessageType.report:
             chat_message.status = MessageStatus.processing
-            if settings.google_drive_folder_dumped:
+            # Передаем сообщение на следующий этап очереди - разбор отчета
+            chat_message.attempts = 0
+            chat_message.available_at = None
+            chat_message.locked_until = None
+            chat_message.locked_by = None
+            if settings.google_drive_folder_dumped and not COMBINED_MODE:
                 dump_message_silently(chat_message)
-            asyncio.create_task(run_safe(process_report, chat_message_id))
-        else:
+        elif message_type == MessageType.spam:
             chat_message.status = MessageStatus.spam
         await session.commit()
-    if chat_message.status == MessageStatus.spam:
+    if chat_message.status != MessageStatus.processing:
         try:
             await send_reactions(ChatMessageReactionRequest(
                 chat_id=chat_message.chat_id,
@@ -42,43 +95,55 @@ async def process_message(chat_message_id: int) -> None:
 
 
 async def process_report(chat_message_id: int):
+    reports: list[Report] = []
     async with async_session() as session:
         chat_message: ChatMessage = (await session.exec(
             select(ChatMessage).where(ChatMessage.id == chat_message_id)
         )).one_or_none()
+        # Соединение не держится во время запросов к LLM: кэш ответов берет свое,
+        # а сообщение остается загруженным (expire_on_commit=False)
+        await session.commit()
         try:
-            departments: list[Department] = (await session.exec(select(Department))).all()
-            operations: list[Operation] = (await session.exec(select(Operation))).all()
-            crops: list[Crop] = (await session.exec(select(Crop))).all()
-            created_reports = await solve_reports(
-                message_id=chat_message.id,
-                message_text=chat_message.message_text,
-                message_created_at=chat_message.created_at,
-                departments=departments,
-                crops=crops,
-                operations=operations,
-            )
-            session.add_all(created_reports)
-            chat_message.status = MessageStatus.processed
-            chat_message.status_text = f"Кол-во отчетов: {len(created_reports)}"
-            if settings.google_drive_folder_dumped:
-                await session.flush()
-                created_ids = [r.id for r in created_reports]
-                reports: list[Report] = (await session.exec(
-                    select(Report)
-                    .options(
-                        selectinload(Report.department),
-                        selectinload(Report.operation),
-                        selectinload(Report.crop)
-                    )
-                    .where(Report.id.in_(created_ids))
-                )).all()
-                dump_report_silently(chat_message, reports)
+            dictionaries = await get_dictionaries()
+            if COMBINED_MODE:
+                message_type, created_reports = await analyze_message(
+                    message_id=chat_message.id,
+                    message_text=chat_message.message_text,
+                    message_created_at=chat_message.created_at,
+                    dictionaries=dictionaries,
+                )
+            else:
+                message_type = MessageType.report
+                created_reports = await solve_reports(
+                    message_id=chat_message.id,
+                    message_text=chat_message.message_text,
+                    message_created_at=chat_message.created_at,
+                    dictionaries=dictionaries,
+                )
+            if message_type == MessageType.spam:
+                chat_message.status = MessageStatus.spam
+            else:
+                session.add_all(created_reports)
+                await add_to_daily_totals(session, created_reports)
+                reports = created_reports
+                chat_message.status = MessageStatus.processed
+                chat_message.status_text = f"Кол-во отчетов: {len(created_reports)}"
+                if settings.google_drive_folder_dumped and COMBINED_MODE:
+                    dump_message_silently(chat_message)
         except Exception as e:
+            if chat_message.attempts < settings.job_max_attempts:
+                # Повторная попытка будет запланирована очередью
+                raise
             chat_message.status = MessageStatus.failed
             chat_message.status_text = str(e)
             logger.error(f"Error: {e}", exc_info=True)
         await session.commit()
+    if settings.google_drive_folder_dumped and chat_message.status == MessageStatus.processed:
+        # Отчеты попадут в файл дня при ближайшей выгрузке, уже после коммита
+        schedule_report_dump(chat_message.created_at)
+    if chat_message.status == MessageStatus.failed:
+        await notify_failed(chat_message)
+        return
     try:
         await send_reactions(ChatMessageReactionRequest(
             chat_id=chat_message.chat_id,
@@ -104,7 +169,19 @@ async def process_report(chat_message_id: int):
                         f"{notes_msg}"
                     )
                 ))
-        elif settings.bot_reply_on_failed and chat_message.status == MessageStatus.failed:
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+
+
+async def notify_failed(chat_message: ChatMessage):
+    """Реакция и ответ в чат для сообщения, обработка которого окончательно не удалась"""
+    try:
+        await send_reactions(ChatMessageReactionRequest(
+            chat_id=chat_message.chat_id,
+            message_id=chat_message.message_id,
+            status=MessageStatus.failed,
+        ))
+        if settings.bot_reply_on_failed:
             await reply_on_message(ChatMessageReplyRequest(
                 chat_id=chat_message.chat_id,
                 message_id=chat_message.message_id,
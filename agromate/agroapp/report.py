@@ -1,13 +1,15 @@
+import io
 import logging
-import os
-import tempfile
 from copy import copy
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Iterable, Union, BinaryIO
 
 from openpyxl import load_workbook, Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.comments import Comment
-from openpyxl.styles import PatternFill
+from openpyxl.styles import PatternFill, Font, Border, Protection, Alignment
 
 from config import settings
 from entities import Report
@@ -19,13 +21,179 @@ TEMPLATE_ROW_IDX = 2
 YELLOW_FILL = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
 
 
-def create_excel_report_file(report_at: datetime, reports: list[Report]) -> str:
-    wb, _ = create_excel_report(report_at, reports)
+@dataclass(frozen=True)
+class CellStyle:
+    font: Font
+    border: Border
+    fill: PatternFill
+    protection: Protection
+    alignment: Alignment
+    number_format: str
+
+    @classmethod
+    def of(cls, cell) -> "CellStyle":
+        # Стили ячейки отдаются как прокси, копируем их один раз при чтении шаблона
+        return cls(
+            font=copy(cell.font),
+            border=copy(cell.border),
+            fill=copy(cell.fill),
+            protection=copy(cell.protection),
+            alignment=copy(cell.alignment),
+            number_format=cell.number_format,
+        )
+
+    def apply(self, cell, fill: Optional[PatternFill] = None):
+        cell.font = self.font
+        cell.border = self.border
+        cell.fill = fill or self.fill
+        cell.protection = self.protection
+        cell.alignment = self.alignment
+        cell.number_format = self.number_format
+
+
+@dataclass(frozen=True)
+class ReportTemplate:
+    """Все, что нужно потоковой записи отчета из шаблона: заголовок, стили строки, ширины колонок и высоты строк"""
+    title: str
+    header: list[tuple[object, CellStyle]]
+    row_styles: list[CellStyle]
+    column_widths: dict[str, float]
+    header_height: Optional[float]
+    row_height: Optional[float]
+
+
+@lru_cache(maxsize=1)
+def load_report_template() -> ReportTemplate:
+    ws = load_workbook(settings.report_template_path).active
+    return ReportTemplate(
+        title=ws.title,
+        header=[(cell.value, CellStyle.of(cell)) for cell in ws[1]],
+        row_styles=[CellStyle.of(cell) for cell in ws[TEMPLATE_ROW_IDX]],
+        column_widths={key: dim.width for key, dim in ws.column_dimensions.items() if dim.width},
+        header_height=ws.row_dimensions[1].height,
+        row_height=ws.row_dimensions[TEMPLATE_ROW_IDX].height,
+    )
+
+
+def create_excel_report_file(report_at: datetime, reports: Iterable[Report]) -> tuple[str, bytes]:
+    """Строит отчет в памяти, без временного файла на диске. Возвращает имя файла и его содержимое."""
     filename = f"Отчет от {report_at.strftime('%d.%m.%Y %H:%M')}.xlsx"
-    file_path = os.path.join(tempfile.gettempdir(), filename)
-    save_excel(wb, file_path)
-    logger.info(f"Created report on '{report_at}': {file_path}")
-    return file_path
+    output = io.BytesIO()
+    rows = write_excel_report(report_at, reports, output)
+    logger.info(f"Created report on '{report_at}' with {rows} rows: {filename}")
+    return filename, output.getvalue()
+
+
+class ExcelReportWriter:
+    """
+    Пишет отчет в режиме write-only: строки не держатся в памяти (openpyxl сбрасывает их во временный файл),
+    а стили регистрируются в книге один раз и дальше только присваиваются ячейкам.
+    """
+
+    def __init__(self, period: str):
+        template = load_report_template()
+        self.wb = Workbook(write_only=True)
+        title = template.title.format(report_on=period)
+        # Excel ограничивает имя листа 31 символом, для длинных периодов остается только период
+        self.ws = self.wb.create_sheet(title if len(title) <= 31 else period[:31])
+        for key, width in template.column_widths.items():
+            self.ws.column_dimensions[key].width = width
+        # Высоты строк пишутся вместе со строкой, поэтому задаются до append.
+        # Для строк отчета достаточно высоты по умолчанию листа, чтобы не копить размеры каждой строки в памяти
+        if template.header_height:
+            self.ws.row_dimensions[1].height = template.header_height
+        if template.row_height:
+            self.ws.sheet_format.defaultRowHeight = template.row_height
+            self.ws.sheet_format.customHeight = True
+
+        header = []
+        for value, style in template.header:
+            cell = WriteOnlyCell(self.ws, value)
+            cell._style = self._styled(style)
+            header.append(cell)
+        self.ws.append(header)
+
+        self.row_styles = [self._styled(style) for style in template.row_styles]
+        self.unresolved_styles = [self._styled(style, YELLOW_FILL) for style in template.row_styles]
+        self.rows = 0
+
+    def _styled(self, style: CellStyle, fill: Optional[PatternFill] = None):
+        # Ячейка-прототип регистрирует стиль в книге, дальше копируется только индекс стиля
+        cell = WriteOnlyCell(self.ws)
+        style.apply(cell, fill)
+        return cell._style
+
+    def append(self, report: Report):
+        unresolved = report_unresolved_columns(report)
+        cells = []
+        for col_idx, value in enumerate(report_row_values(report), start=1):
+            cell = WriteOnlyCell(self.ws, value)
+            if col_idx in unresolved:
+                cell._style = copy(self.unresolved_styles[col_idx - 1])
+                if report.note:
+                    cell.comment = Comment(report.note, settings.bot_name)
+            else:
+                cell._style = copy(self.row_styles[col_idx - 1])
+            cells.append(cell)
+        self.ws.append(cells)
+        self.rows += 1
+
+    def extend(self, reports: Iterable[Report]):
+        for report in reports:
+            self.append(report)
+
+    def save(self, output: Union[str, BinaryIO]):
+        self.wb.save(output)
+
+
+def write_excel_report(report_on, reports: Iterable[Report], output: Union[str, BinaryIO]) -> int:
+    """
+    Пишет отчет за день потоково (см. ExcelReportWriter)
+
+    Returns:
+        Количество записанных строк отчетов
+    """
+    writer = ExcelReportWriter(report_on.strftime("%d.%m.%Y"))
+    writer.extend(reports)
+    writer.save(output)
+    return writer.rows
+
+
+def report_row_values(report: Report) -> list:
+    return [
+        report.worked_on,
+        resolve_dict_value(
+            report.department.subdivision if report.department else None,
+            report.department_raw,
+            report.department_predicted
+        ),
+        resolve_dict_value(
+            report.operation.operation_name if report.operation else None,
+            report.operation_raw,
+            report.operation_predicted
+        ),
+        resolve_dict_value(
+            report.crop.crop_name if report.crop else None,
+            report.crop_raw,
+            report.crop_predicted
+        ),
+        report.day_area,
+        report.cumulative_area,
+        report.day_yield or None,
+        report.cumulative_yield or None
+    ]
+
+
+def report_unresolved_columns(report: Report) -> set[int]:
+    """Колонки подразделения, операции и культуры, не сопоставленные со справочником"""
+    columns = set()
+    if not report.department:
+        columns.add(2)
+    if not report.operation:
+        columns.add(3)
+    if not report.crop:
+        columns.add(4)
+    return columns
 
 
 def create_excel_report(report_on, reports) -> tuple[Workbook, int]:
@@ -43,49 +211,18 @@ def create_excel_from_template(report_on):
 
 def append_reports_to_excel(wb: Workbook, start_row_idx: int, reports: list[Report]) -> int:
     ws = wb.active
+    template_cells = ws[TEMPLATE_ROW_IDX]
     for i, report in enumerate(reports):
         row_idx = start_row_idx + i
-        vals = [
-            report.worked_on,
-            resolve_dict_value(
-                report.department.subdivision if report.department else None,
-                report.department_raw,
-                report.department_predicted
-            ),
-            resolve_dict_value(
-                report.operation.operation_name if report.operation else None,
-                report.operation_raw,
-                report.operation_predicted
-            ),
-            resolve_dict_value(
-                report.crop.crop_name if report.crop else None,
-                report.crop_raw,
-                report.crop_predicted
-            ),
-            report.day_area,
-            report.cumulative_area,
-            report.day_yield or None,
-            report.cumulative_yield or None
-        ]
-        for col_idx, value in enumerate(vals, start=1):
-            tmp = ws.cell(row=TEMPLATE_ROW_IDX, column=col_idx)
+        unresolved = report_unresolved_columns(report)
+        for col_idx, value in enumerate(report_row_values(report), start=1):
             dst = ws.cell(row=row_idx, column=col_idx, value=value)
-            dst.font = copy(tmp.font)
-            dst.border = copy(tmp.border)
-            dst.fill = copy(tmp.fill)
-            dst.protection = copy(tmp.protection)
-            dst.alignment = copy(tmp.alignment)
-            dst.number_format = copy(tmp.number_format)
-
-            if col_idx in (2, 3, 4):
-                if (
-                        (col_idx == 2 and not report.department) or
-                        (col_idx == 3 and not report.operation) or
-                        (col_idx == 4 and not report.crop)
-                ):
-                    dst.fill = YELLOW_FILL
-                    if report.note:
-                        dst.comment = Comment(report.note, settings.bot_name)
+            # Копируем индекс стиля целиком вместо копирования каждого объекта стиля
+            dst._style = copy(template_cells[col_idx - 1]._style)
+            if col_idx in unresolved:
+                dst.fill = YELLOW_FILL
+                if report.note:
+                    dst.comment = Comment(report.note, settings.bot_name)
 
     next_row_idx = start_row_idx + len(reports)
     return next_row_idx
@@ -105,7 +242,7 @@ def resolve_dict_value(
     return None
 
 
-def save_excel(wb: Workbook, file_path: str) -> str:
-    with open(file_path, "w+t"):
-        wb.save(file_path)
-        return file_path
+def excel_to_bytes(wb: Workbook) -> bytes:
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
@@ -0,0 +1,109 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import date
+from typing import AsyncIterator, Optional
+
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+
+from config import settings
+from database import async_session
+from entities import Report
+from report import ExcelReportWriter, load_report_template, report_row_values
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReportFilter:
+    date_from: date
+    date_to: date
+    department_id: Optional[int] = None
+    operation_id: Optional[int] = None
+    crop_id: Optional[int] = None
+
+    @property
+    def period(self) -> str:
+        if self.date_from == self.date_to:
+            return self.date_from.strftime("%d.%m.%Y")
+        return f"{self.date_from.strftime('%d.%m.%Y')}-{self.date_to.strftime('%d.%m.%Y')}"
+
+    def statement(self):
+        stmt = (
+            select(Report)
+            .options(
+                # Справочники - связи многие-к-одному, подгружаются в том же запросе, что и порция отчетов
+                joinedload(Report.department),
+                joinedload(Report.operation),
+                joinedload(Report.crop),
+            )
+            .where(Report.worked_on >= self.date_from)
+            .where(Report.worked_on <= self.date_to)
+            .order_by(Report.worked_on, Report.id)
+        )
+        if self.department_id is not None:
+            stmt = stmt.where(Report.department_id == self.department_id)
+        if self.operation_id is not None:
+            stmt = stmt.where(Report.operation_id == self.operation_id)
+        if self.crop_id is not None:
+            stmt = stmt.where(Report.crop_id == self.crop_id)
+        return stmt
+
+
+async def stream_report_batches(report_filter: ReportFilter) -> AsyncIterator[list[Report]]:
+    """
+    Отчеты по фильтру порциями через серверный курсор: в памяти одновременно
+    находится не больше export_batch_size отчетов, независимо от длины периода.
+    """
+    async with async_session() as session:
+        result = await session.stream_scalars(
+            report_filter.statement().execution_options(yield_per=settings.export_batch_size)
+        )
+        async for batch in result.partitions():
+            yield batch
+            # Выгруженные отчеты больше не нужны, не копим их в identity map сессии
+            session.expunge_all()
+
+
+async def export_reports_csv(report_filter: ReportFilter) -> AsyncIterator[bytes]:
+    # BOM, чтобы Excel открыл CSV в UTF-8
+    yield "\ufeff".encode("utf-8")
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=";")
+    writer.writerow([value for value, _ in load_report_template().header] + ["Примечание"])
+    rows = 0
+    async for batch in stream_report_batches(report_filter):
+        for report in batch:
+            writer.writerow(report_row_values(report) + [report.note or ""])
+        rows += len(batch)
+        yield output.getvalue().encode("utf-8")
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
+    logger.info(f"Exported {rows} reports for {report_filter.period} to CSV")
+
+
+async def export_reports_xlsx(report_filter: ReportFilter) -> str:
+    """
+    Пишет отчеты в .xlsx во временный файл и возвращает путь к нему; файл удаляет вызывающий.
+    Формат xlsx - zip-архив, поэтому отдавать его можно только после записи целиком.
+    """
+    writer = ExcelReportWriter(report_filter.period)
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        async for batch in stream_report_batches(report_filter):
+            # Заполнение книги - работа процессора, не блокируем цикл событий
+            await asyncio.to_thread(writer.extend, batch)
+        await asyncio.to_thread(writer.save, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    logger.info(f"Exported {writer.rows} reports for {report_filter.period} to xlsx")
+    return path
@@ -0,0 +1,152 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class ArtifactStore(ABC):
+    """
+    Хранилище выгрузок сообщений и отчетов. Методы синхронные и вызываются
+    через пул загрузок (uploads.run_upload), чтобы не блокировать цикл событий.
+    """
+    # ID папок выдает удаленный API: их стоит кэшировать в таблице drive_folder
+    remote_folders = False
+
+    @abstractmethod
+    def get_folder(self, name: str) -> str:
+        """Возвращает ID папки с указанным именем, создавая ее при необходимости"""
+
+    @abstractmethod
+    def put_document(self, filename: str, content: bytes, folder_id: str) -> tuple[str, str]:
+        """Сохраняет .docx в папку. Возвращает ID файла и ссылку на него"""
+
+    @abstractmethod
+    def put_spreadsheet(self, filename: str, content: bytes) -> tuple[str, str]:
+        """Сохраняет .xlsx в корень хранилища. Возвращает ID файла и ссылку на него"""
+
+    @abstractmethod
+    def overwrite_spreadsheet(self, file_id: str, filename: str, content: bytes) -> tuple[str, str]:
+        """Перезаписывает содержимое ранее сохраненного .xlsx"""
+
+
+class DriveArtifactStore(ArtifactStore):
+    remote_folders = True
+
+    def __init__(self):
+        # Импорт здесь: клиент Google нужен только этому хранилищу
+        import google_drive
+        self.drive = google_drive
+
+    def get_folder(self, name: str) -> str:
+        return self.drive.find_or_create_subfolder(name)
+
+    def put_document(self, filename: str, content: bytes, folder_id: str) -> tuple[str, str]:
+        return self.drive.upload_word_file_to_folder(filename, content, folder_id)
+
+    def put_spreadsheet(self, filename: str, content: bytes) -> tuple[str, str]:
+        return self.drive.upload_excel_file_to_folder(filename, content)
+
+    def overwrite_spreadsheet(self, file_id: str, filename: str, content: bytes) -> tuple[str, str]:
+        return self.drive.overwrite_excel_file_by_id(file_id, filename, content)
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Файлы на локальном диске: для разработки, нагрузочных тестов и бенчмарков без Google"""
+
+    def __init__(self, root: str, public_url: Optional[str] = None):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.public_url = public_url.rstrip("/") if public_url else None
+
+    def _url(self, file_id: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{quote(file_id)}"
+        return (self.root / file_id).as_uri()
+
+    def _write(self, file_id: str, content: bytes) -> tuple[str, str]:
+        path = self.root / file_id
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(content)
+        # Замена атомарная: читатель не увидит наполовину записанный файл
+        os.replace(tmp_path, path)
+        logger.info(f"Saved artifact: {path}")
+        return file_id, self._url(file_id)
+
+    def get_folder(self, name: str) -> str:
+        (self.root / name).mkdir(parents=True, exist_ok=True)
+        return name
+
+    def put_document(self, filename: str, content: bytes, folder_id: str) -> tuple[str, str]:
+        return self._write(f"{folder_id}/{filename}", content)
+
+    def put_spreadsheet(self, filename: str, content: bytes) -> tuple[str, str]:
+        return self._write(filename, content)
+
+    def overwrite_spreadsheet(self, file_id: str, filename: str, content: bytes) -> tuple[str, str]:
+        return self._write(file_id, content)
+
+
+class S3ArtifactStore(ArtifactStore):
+    """S3-совместимое хранилище (например, MinIO). Папки - это префиксы ключей."""
+
+    def __init__(self):
+        try:
+            import boto3
+        except ImportError as e:
+            raise ImportError("Для STORAGE_BACKEND=s3 нужен пакет boto3") from e
+        if not settings.s3_bucket:
+            raise ValueError("Для STORAGE_BACKEND=s3 нужно указать S3_BUCKET")
+        self.bucket = settings.s3_bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.s3_endpoint_url,
+            aws_access_key_id=settings.s3_access_key,
+            aws_secret_access_key=settings.s3_secret_key,
+            region_name=settings.s3_region,
+        )
+
+    def _put(self, key: str, content: bytes, content_type: str) -> tuple[str, str]:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=content, ContentType=content_type)
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=settings.s3_url_expires_seconds,
+        )
+        logger.info(f"Uploaded artifact to s3://{self.bucket}/{key}")
+        return key, url
+
+    def get_folder(self, name: str) -> str:
+        return name
+
+    def put_document(self, filename: str, content: bytes, folder_id: str) -> tuple[str, str]:
+        return self._put(f"{folder_id}/{filename}", content, DOCX_MIMETYPE)
+
+    def put_spreadsheet(self, filename: str, content: bytes) -> tuple[str, str]:
+        return self._put(filename, content, XLSX_MIMETYPE)
+
+    def overwrite_spreadsheet(self, file_id: str, filename: str, content: bytes) -> tuple[str, str]:
+        return self._put(file_id, content, XLSX_MIMETYPE)
+
+
+@lru_cache(maxsize=1)
+def get_store() -> ArtifactStore:
+    if settings.storage_backend == "drive":
+        store = DriveArtifactStore()
+    elif settings.storage_backend == "local":
+        store = LocalArtifactStore(settings.storage_local_path, settings.storage_public_url)
+    elif settings.storage_backend == "s3":
+        store = S3ArtifactStore()
+    else:
+        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+    logger.info(f"Artifact store: {type(store).__name__}")
+    return store
@@ -0,0 +1,38 @@
+from duplicates import content_hash, simhash, hamming_distance, SIMHASH_BITS
+from config import settings
+
+REPORT = "Пахота зяби под сою\nПо ПУ 26/488\nОтд 12 26/221\nОтд 16 0/22"
+
+
+def test_content_hash_ignores_case_spaces_and_yo():
+    variants = [
+        "Пахота зяби под сою По ПУ 26/488 Отд 12 26/221 Отд 16 0/22",
+        "  пахота\xa0ЗЯБИ под сою\n\nпо пу 26/488\tотд 12 26/221 отд 16 0/22 ",
+    ]
+    assert {content_hash(v) for v in variants} == {content_hash(REPORT)}
+    assert content_hash("Подкормка озимых") == content_hash("подкормка озимых")
+    assert content_hash("Уборка, всё") == content_hash("Уборка, все")
+
+
+def test_content_hash_differs_on_numbers():
+    assert content_hash(REPORT) != content_hash(REPORT.replace("0/22", "0/23"))
+
+
+def test_simhash_is_stable_signed_64_bit():
+    value = simhash(REPORT)
+    assert value == simhash(REPORT.upper())
+    assert -(1 << (SIMHASH_BITS - 1)) <= value < 1 << (SIMHASH_BITS - 1)
+
+
+def test_simhash_near_and_far():
+    near = REPORT.replace("0/22", "0/23")
+    far = "Дискование после подсолнечника\nПо ПУ 122/1022\nОтд 17 50/610"
+    assert hamming_distance(simhash(REPORT), simhash(near)) <= settings.near_duplicate_distance
+    assert hamming_distance(simhash(REPORT), simhash(far)) > settings.near_duplicate_distance
+
+
+def test_hamming_distance_of_signed_values():
+    assert hamming_distance(0, 0) == 0
+    assert hamming_distance(0, -1) == SIMHASH_BITS
+    assert hamming_distance(-1, -2) == 1
+    assert hamming_distance(5, 6) == 2
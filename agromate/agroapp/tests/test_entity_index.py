@@ -0,0 +1,53 @@
+import pytest
+
+from pipelines.entity_resolution import FuzzyMatcher
+from pipelines.utils import EntityIndex, build_department_index, build_operation_index
+
+
+@pytest.fixture(scope="module")
+def department_index(dictionary_entities) -> EntityIndex:
+    departments, _, _ = dictionary_entities
+    return build_department_index(departments)
+
+
+def test_unique_keys_match(department_index, dictionary_entities):
+    departments, _, _ = dictionary_entities
+    tsk = next(d for d in departments if d.subdivision == "ТСК")
+    assert department_index.match("ТСК") == tsk.id
+    assert department_index.match(" тск ") == tsk.id
+    number_18 = next(d for d in departments if d.department_number == "18")
+    assert department_index.match("18") == number_18.id
+
+
+@pytest.mark.parametrize("name", ["Север", "Кавказ", "Центр", "Юг", "АОР"])
+def test_production_units_and_aor_are_ambiguous(department_index, dictionary_entities, name):
+    departments, _, _ = dictionary_entities
+    expected = tuple(sorted(
+        d.id for d in departments if name in (d.subdivision, d.production_unit)
+    ))
+    assert len(expected) > 1
+    with pytest.raises(ValueError, match="Неоднозначное") as error:
+        department_index.match(name)
+    assert str(expected) in str(error.value)
+
+
+@pytest.mark.parametrize("name", ["Север", "АОР"])
+def test_ambiguous_keys_are_not_resolved_fuzzily(department_index, name):
+    assert FuzzyMatcher(department_index).resolve(name) == (None, None, 0.0)
+
+
+def test_placeholders_are_not_keys(department_index):
+    with pytest.raises(ValueError, match="Не найдено подразделение"):
+        department_index.match("Нет ПУ")
+
+
+def test_unknown_value(dictionary_entities):
+    _, operations, _ = dictionary_entities
+    with pytest.raises(ValueError, match="Не найдена операция: Косьба"):
+        build_operation_index(operations).match("Косьба")
+
+
+def test_key_shared_by_entities_is_ambiguous():
+    index = EntityIndex("культура", "Не найдена культура", [("Пшеница", 1), ("пшеница ", 2), ("Рожь", 3)])
+    assert index.ambiguous == {"пшеница": (1, 2)}
+    assert index.match("РОЖЬ") == 3
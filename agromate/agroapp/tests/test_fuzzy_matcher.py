@@ -0,0 +1,47 @@
+import pytest
+
+from config import settings
+from pipelines.entity_resolution import FuzzyMatcher
+from pipelines.utils import EntityIndex
+
+
+@pytest.fixture(scope="module")
+def matcher() -> FuzzyMatcher:
+    return FuzzyMatcher(EntityIndex("операция", "Не найдена операция", [
+        ("Пахота", 1),
+        ("Дискование", 2),
+        # Алиас той же операции не считается соперником при проверке отрыва
+        ("Дискованье", 2),
+        ("Обработка почвы 1", 3),
+        ("Обработка почвы 2", 4),
+        ("Сев", 5),
+    ]))
+
+
+def test_exact_match(matcher):
+    assert matcher.resolve(" ПАХОТА ") == (1, "Пахота", 1.0)
+
+
+@pytest.mark.parametrize("value, entity_id", [("пахотаа", 1), ("Дисковане", 2), ("Дискованиье", 2)])
+def test_typo_above_threshold(matcher, value, entity_id):
+    resolved_id, _, score = matcher.resolve(value)
+    assert resolved_id == entity_id
+    assert settings.entity_match_threshold <= score < 1.0
+
+
+def test_below_threshold(matcher):
+    resolved_id, label, score = matcher.resolve("Уборка")
+    assert (resolved_id, label) == (None, None)
+    assert score < settings.entity_match_threshold
+
+
+def test_close_entities_fail_margin(matcher):
+    # Оба кандидата похожи одинаково: порог пройден, но отрыв от соседа меньше MIN_MARGIN
+    resolved_id, label, score = matcher.resolve("Обработка почвы 3")
+    assert (resolved_id, label) == (None, None)
+    assert score >= settings.entity_match_threshold
+
+
+@pytest.mark.parametrize("value", ["Сеф", "18", "1 2"])
+def test_short_keys_and_numbers_are_exact_only(matcher, value):
+    assert matcher.resolve(value) == (None, None, 0.0)
@@ -0,0 +1,147 @@
+"""
+Шторм повторных доставок: одни и те же сообщения Telegram приходят многократно и одновременно,
+по одному и пачками (в том числе с повторами внутри пачки), как при ретраях бота
+и повторной доставке обновлений после перезапуска.
+"""
+import asyncio
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func
+from sqlmodel import select
+
+pytestmark = pytest.mark.db
+
+MESSAGES = 30
+USERS = 3
+REPEATS = 5
+BATCH_SIZE = 8
+
+
+def make_messages(chat_id: str):
+    from models import ChatMessageCreateRequest
+
+    now = datetime.now(timezone.utc)
+    return [
+        ChatMessageCreateRequest(
+            username="storm",
+            user_id=f"{chat_id}-user-{i % USERS}",
+            chat_id=chat_id,
+            message_id=str(i),
+            message_text=f"Пахота ПУ {i} {i}/{i * 10}",
+            created_at=now,
+        )
+        for i in range(MESSAGES)
+    ]
+
+
+async def ingest(requests):
+    from api import ingest_messages
+    from database import async_session
+
+    async with async_session() as session:
+        return list(zip(requests, await ingest_messages(session, requests)))
+
+
+async def replay_storm(monkeypatch) -> dict:
+    import api
+    from config import settings
+    from database import async_engine, async_session, init_db
+    from entities import ChatMessage, UserSerialCounter
+
+    monkeypatch.setattr(settings, "google_drive_folder_dumped", True)
+    notified = []
+    notify_workers = api.notify_workers
+
+    async def counting_notify_workers(session):
+        notified.append(1)
+        await notify_workers(session)
+
+    monkeypatch.setattr(api, "notify_workers", counting_notify_workers)
+
+    try:
+        await init_db()
+        chat_id = f"storm-{uuid.uuid4().hex[:8]}"
+        messages = make_messages(chat_id)
+        deliveries = messages * REPEATS
+        random.Random(0).shuffle(deliveries)
+
+        requests = []
+        i = 0
+        while i < len(deliveries):
+            if i % 3 == 0:
+                requests.append(ingest([deliveries[i]]))
+                i += 1
+            else:
+                batch = deliveries[i:i + BATCH_SIZE]
+                # Повтор внутри одной пачки
+                requests.append(ingest(batch + batch[:1]))
+                i += BATCH_SIZE
+        results = [pair for result in await asyncio.gather(*requests) for pair in result]
+        storm_notifications = len(notified)
+
+        # Повтор уже сохраненных сообщений после шторма
+        replay = await ingest(messages)
+        async with async_session() as session:
+            rows = (await session.exec(
+                select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+            )).all()
+            counters = dict((await session.exec(
+                select(UserSerialCounter.user_id, UserSerialCounter.last_serial)
+                .where(UserSerialCounter.user_id.in_({m.user_id for m in messages}))
+            )).all())
+            duplicate_keys = (await session.exec(
+                select(ChatMessage.message_id)
+                .where(ChatMessage.chat_id == chat_id)
+                .group_by(ChatMessage.message_id)
+                .having(func.count() > 1)
+            )).all()
+        return {
+            "messages": messages,
+            "results": results,
+            "replay": replay,
+            "rows": rows,
+            "counters": counters,
+            "duplicate_keys": duplicate_keys,
+            "storm_notifications": storm_notifications,
+            "replay_notifications": len(notified) - storm_notifications,
+        }
+    finally:
+        await async_engine.dispose()
+
+
+def test_delivery_storm_stores_each_message_once(monkeypatch):
+    from models import MessageStatus
+
+    storm = asyncio.run(replay_storm(monkeypatch))
+    messages, rows = storm["messages"], storm["rows"]
+
+    # Одна строка (и одна задача обработки) на каждое (chat_id, message_id)
+    assert storm["duplicate_keys"] == []
+    assert len(rows) == len(messages)
+    assert all(row.status == MessageStatus.new for row in rows)
+    stored = {row.message_id: row.id for row in rows}
+
+    ids = defaultdict(set)
+    created = defaultdict(int)
+    for request, response in storm["results"]:
+        ids[request.message_id].add(response.id)
+        created[request.message_id] += not response.duplicate
+    assert {key: value for key, value in ids.items() if value != {stored[key]}} == {}
+    assert {key: count for key, count in created.items() if count != 1} == {}
+
+    # Повторная доставка возвращает существующий ID с duplicate=True и не будит воркеры
+    assert all(response.duplicate and response.id == stored[r.message_id] for r, response in storm["replay"])
+    assert storm["replay_notifications"] == 0
+    assert storm["storm_notifications"] <= len(messages)
+
+    # Номера выдаются только сохраненным сообщениям: без пропусков и повторов
+    serials = defaultdict(list)
+    for row in rows:
+        serials[row.user_id].append(row.serial_num)
+    for user_id, user_serials in serials.items():
+        assert sorted(user_serials) == list(range(1, len(user_serials) + 1))
+        assert storm["counters"][user_id] == len(user_serials)
@@ -0,0 +1,46 @@
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from llm_cache import cache_key
+
+
+class Answer(BaseModel):
+    value: str
+
+
+class OtherAnswer(BaseModel):
+    value: int
+
+
+def _model(name: str = "test-model", temperature: float = 0.0) -> ChatOpenAI:
+    return ChatOpenAI(model=name, temperature=temperature, api_key="test", base_url="http://localhost:1")
+
+
+MESSAGES = [SystemMessage(content="Разбери отчет"), HumanMessage(content="Пахота ПУ Север 10/100")]
+
+
+def test_key_is_stable():
+    assert cache_key(_model(), MESSAGES, Answer) == cache_key(_model(), list(MESSAGES), Answer)
+    assert len(cache_key(_model(), MESSAGES, None)) == 64
+
+
+@pytest.mark.parametrize("model, messages, schema", [
+    (_model("other-model"), MESSAGES, Answer),
+    (_model(temperature=0.5), MESSAGES, Answer),
+    (_model(), [MESSAGES[0], HumanMessage(content="Пахота ПУ Север 10/101")], Answer),
+    (_model(), MESSAGES[1:], Answer),
+    # Тот же текст от другой роли
+    (_model(), [HumanMessage(content="Разбери отчет"), MESSAGES[1]], Answer),
+    (_model(), MESSAGES, OtherAnswer),
+    (_model(), MESSAGES, None),
+])
+def test_key_changes(model, messages, schema):
+    assert cache_key(model, messages, schema) != cache_key(_model(), MESSAGES, Answer)
+
+
+def test_message_boundaries_are_part_of_key():
+    joined = [HumanMessage(content="ab")]
+    split = [HumanMessage(content="a"), HumanMessage(content="b")]
+    assert cache_key(_model(), joined, None) != cache_key(_model(), split, None)
@@ -0,0 +1,86 @@
+import os
+import re
+
+import pytest
+import yaml
+
+from conftest import DATA_PATH
+from models import MessageType
+from pipelines.message_prefilter import MessagePrefilter
+
+
+def few_shot_examples() -> list[tuple[str, str]]:
+    """Примеры классификатора из prompts.yaml: (текст сообщения, message_type)"""
+    with open(os.path.join(DATA_PATH, "configs", "prompts.yaml"), encoding="utf-8") as f:
+        examples = yaml.safe_load(f)["spam_filter_few_shot_examples_str"]
+    return [
+        (text.strip(), message_type)
+        for text, message_type in re.findall(
+            r'INPUT:\s*<<<(.*?)>>>.*?"message_type":\s*"(\w+)"', examples, flags=re.DOTALL
+        )
+    ]
+
+
+NOT_REPORTS = [
+    # Поправка к ранее отправленному отчету
+    "Поправка: пахота отд 12 не 46/298 а 40/298",
+    # План
+    "Пахота ПУ Юг 50/300 - ожидаем к вечеру",
+    # Отмена
+    "Пахота по ПУ Север 20/100 остановлена из-за дождя, не считать",
+    # Просьба уточнить без вопросительного знака
+    "Пахота под сах св\nПо Пу 77/518\nОтд 12 46/298\n\nВроде всё правильно, уточните",
+    # Площадь без операции
+    "По Пу 77/518\nОтд 12 46/298",
+    # Неизвестное название ПУ
+    "Пахота ПУ Луна 50/300",
+]
+
+STRICT_REPORTS = [
+    "Пахота под сах св\nПо Пу 77/518\nОтд 12 46/298\nОтд 16 21/143\n\n"
+    "Диск оз пшеницы\nПо Пу 28/8872\nОтд 17 28/2097\n\n"
+    "2-е диск под сах св\nПо Пу 189/1763\nОтд 11 60/209",
+    "27.10\nУборка свеклы\nОтд10-45/216\nПо ПУ 45/1569",
+    "Пахота ПУ Юг 50/300",
+]
+
+
+@pytest.fixture(scope="module")
+def prefilter(dictionary_entities) -> MessagePrefilter:
+    return MessagePrefilter(*dictionary_entities)
+
+
+def test_few_shot_examples_are_parsed():
+    examples = few_shot_examples()
+    assert len(examples) >= 6
+    assert {message_type for _, message_type in examples} == {"field_report", "non_report"}
+
+
+@pytest.mark.parametrize("text, message_type", few_shot_examples())
+def test_few_shot_examples_are_never_misclassified(prefilter, text, message_type):
+    decision = prefilter.classify(text)
+    if message_type == "non_report":
+        assert decision != MessageType.report
+    else:
+        assert decision != MessageType.spam
+
+
+@pytest.mark.parametrize("text", NOT_REPORTS)
+def test_not_strict_reports_go_to_llm(prefilter, text):
+    # Спамом их тоже не считаем: решение за LLM
+    assert prefilter.classify(text) is None
+
+
+@pytest.mark.parametrize("text", STRICT_REPORTS)
+def test_strict_reports_skip_llm(prefilter, text):
+    assert prefilter.classify(text) == MessageType.report
+
+
+@pytest.mark.parametrize("text", ["Всем доброе утро!", "Спасибо, принято", "Когда будет дождь?", "👍"])
+def test_chatter_is_spam(prefilter, text):
+    assert prefilter.classify(text) == MessageType.spam
+
+
+@pytest.mark.parametrize("text", ["Пахота идет", "Отд 12 завтра", "Собираемся в 10"])
+def test_messages_with_terms_or_numbers_are_not_spam(prefilter, text):
+    assert prefilter.classify(text) != MessageType.spam
@@ -0,0 +1,70 @@
+import io
+from datetime import date
+
+import pytest
+from openpyxl import load_workbook
+
+from config import settings
+from entities import Report, Department, Operation, Crop
+from report import CellStyle, write_excel_report, create_excel_report, excel_to_bytes, YELLOW_FILL
+
+REPORT_ON = date(2025, 10, 20)
+
+
+@pytest.fixture(scope="module")
+def reports() -> list[Report]:
+    department = Department(id=1, department_number="12", subdivision="АОР", production_unit="Север")
+    operation = Operation(id=1, operation_name="Пахота")
+    crop = Crop(id=1, crop_name="Соя товарная")
+    return [
+        Report(id=1, worked_on=REPORT_ON, department=department, operation=operation, crop=crop,
+               day_area=26.0, cumulative_area=221.0),
+        Report(id=2, worked_on=REPORT_ON, department=department, operation=operation,
+               crop_raw="Сояя", note="Не найдена культура", day_area=10.0, cumulative_area=20.0,
+               day_yield=5.5, cumulative_yield=11.0),
+    ]
+
+
+@pytest.fixture(scope="module")
+def sheets(reports):
+    """Лист потоковой записи и лист, заполненный по шаблону обычным способом"""
+    output = io.BytesIO()
+    assert write_excel_report(REPORT_ON, reports, output) == len(reports)
+    streamed = load_workbook(io.BytesIO(output.getvalue())).active
+    wb, _ = create_excel_report(REPORT_ON, reports)
+    expected = load_workbook(io.BytesIO(excel_to_bytes(wb))).active
+    return streamed, expected
+
+
+def _height(ws, row_idx):
+    return ws.row_dimensions[row_idx].height or ws.sheet_format.defaultRowHeight
+
+
+def test_title_widths_and_heights_match_template(sheets):
+    streamed, expected = sheets
+    assert streamed.title == expected.title
+    template = load_workbook(settings.report_template_path).active
+    for key, dim in template.column_dimensions.items():
+        if dim.width:
+            assert streamed.column_dimensions[key].width == pytest.approx(dim.width)
+    for row_idx in (1, 2, 3):
+        assert _height(streamed, row_idx) == pytest.approx(_height(expected, row_idx))
+
+
+def test_cells_match_template_fill(sheets, reports):
+    streamed, expected = sheets
+    # Шаблон содержит пустые оформленные строки, сравниваются заголовок и строки отчетов
+    assert streamed.max_row == len(reports) + 1
+    for streamed_row, expected_row in zip(streamed.iter_rows(), expected.iter_rows(max_row=streamed.max_row)):
+        for streamed_cell, expected_cell in zip(streamed_row, expected_row, strict=True):
+            assert streamed_cell.value == expected_cell.value
+            assert CellStyle.of(streamed_cell) == CellStyle.of(expected_cell)
+
+
+def test_unresolved_cells_are_highlighted(sheets):
+    streamed, _ = sheets
+    crop_cell = streamed.cell(row=3, column=4)
+    assert crop_cell.value == "Сояя"
+    assert crop_cell.fill.fgColor.rgb.endswith(YELLOW_FILL.fgColor.rgb[-6:])
+    assert crop_cell.comment.text == "Не найдена культура"
+    assert streamed.cell(row=2, column=4).fill.fgColor.rgb != crop_cell.fill.fgColor.rgb
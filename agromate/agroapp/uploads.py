@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import statistics
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Awaitable
+
+from googleapiclient.errors import HttpError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Коды ответа Drive API, после которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Сколько последних загрузок учитывается в перцентилях времени
+LATENCY_WINDOW = 200
+
+_executor = ThreadPoolExecutor(max_workers=settings.upload_workers, thread_name_prefix="upload")
+# Загрузок, одновременно выполняемых в пуле потоков
+_slots = asyncio.Semaphore(settings.upload_workers)
+# Фоновые загрузки (выгрузки сообщений) ждут в ограниченной очереди, их разбирают upload_workers обработчиков
+_queue: asyncio.Queue[Awaitable] = asyncio.Queue(maxsize=settings.upload_queue_size)
+_consumers: set[asyncio.Task] = set()
+
+stats = Counter()
+_latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    # Функции google_drive оборачивают исходную ошибку, она доступна в __cause__
+    for e in (error, error.__cause__):
+        if isinstance(e, HttpError):
+            return e.resp.status in RETRYABLE_STATUSES
+        if isinstance(e, (ConnectionError, TimeoutError)):
+            return True
+    return False
+
+
+async def run_upload(upload_fn: Callable[..., Any], *args) -> Any:
+    """
+    Выполняет синхронную загрузку в пуле потоков, не блокируя цикл событий.
+    Одновременно выполняется не больше upload_workers загрузок, остальные вызывающие ждут.
+    Временные ошибки Drive повторяются с экспоненциальной задержкой.
+    """
+    start = time.perf_counter()
+    try:
+        for attempt in range(1, settings.upload_max_attempts + 1):
+            try:
+                stats["waiting"] += 1
+                async with _slots:
+                    stats["waiting"] -= 1
+                    stats["in_progress"] += 1
+                    try:
+                        result = await asyncio.get_running_loop().run_in_executor(_executor, upload_fn, *args)
+                    finally:
+                        stats["in_progress"] -= 1
+                stats["succeeded"] += 1
+                return result
+            except Exception as e:
+                if attempt >= settings.upload_max_attempts or not _is_retryable(e):
+                    stats["failed"] += 1
+                    raise
+                delay = settings.upload_retry_backoff_seconds * 2 ** (attempt - 1)
+                stats["retries"] += 1
+                logger.warning(f"Upload {upload_fn.__name__} failed (attempt {attempt}), retry in {delay}s: {e}")
+                # Пауза перед повтором не занимает поток пула
+                await asyncio.sleep(delay)
+    finally:
+        _latencies.append(time.perf_counter() - start)
+
+
+async def _consume_uploads():
+    while True:
+        upload = await _queue.get()
+        try:
+            await upload
+        except Exception as e:
+            logger.error(f"Background upload failed: {e}", exc_info=True)
+        finally:
+            _queue.task_done()
+
+
+def submit_upload(upload: Awaitable):
+    """
+    Ставит загрузку в фоновую очередь без ожидания результата, ошибки только логируются.
+    Если в очереди уже upload_queue_size загрузок, новая отбрасывается: обработка сообщений
+    не должна ждать хранилище и копить в памяти содержимое файлов.
+    """
+    if not _consumers:
+        for _ in range(settings.upload_workers):
+            task = asyncio.create_task(_consume_uploads())
+            _consumers.add(task)
+            task.add_done_callback(_consumers.discard)
+    try:
+        _queue.put_nowait(upload)
+    except asyncio.QueueFull:
+        stats["dropped"] += 1
+        logger.error(f"Upload queue is full ({_queue.qsize()}), upload dropped")
+        if asyncio.iscoroutine(upload):
+            upload.close()
+
+
+def upload_metrics() -> dict:
+    latencies = sorted(_latencies)
+    return {
+        # Загрузки, ожидающие начала: фоновая очередь и вызывающие, ждущие свободного потока
+        "queue_depth": _queue.qsize() + stats["waiting"],
+        "queued": _queue.qsize(),
+        "waiting": stats["waiting"],
+        "in_progress": stats["in_progress"],
+        "dropped": stats["dropped"],
+        "succeeded": stats["succeeded"],
+        "failed": stats["failed"],
+        "retries": stats["retries"],
+        "latency_avg_seconds": statistics.mean(latencies) if latencies else None,
+        "latency_p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else None,
+        "latency_max_seconds": latencies[-1] if latencies else None,
+    }
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+import signal
+
+import bot_client
+from jobs import recover_orphaned_jobs, run_job_worker, stop_job_worker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s",
+    handlers=[
+        logging.StreamHandler(),
+    ],
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """
+    Воркер обработки сообщений без HTTP API.
+    Можно запускать в нескольких экземплярах против одной базы данных,
+    схему и справочники инициализирует сервис API.
+    """
+    # Остановка контейнера (SIGTERM) отменяет воркер, и выполняемые задачи возвращаются в очередь
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await bot_client.open_session()
+    try:
+        await recover_orphaned_jobs()
+        await run_job_worker()
+    except asyncio.CancelledError:
+        logger.info("Worker is stopping")
+    finally:
+        await stop_job_worker()
+        await bot_client.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
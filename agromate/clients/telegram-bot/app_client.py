@@ -1,28 +1,138 @@
+import asyncio
+import logging
+from typing import Optional
+
 import aiohttp
 
 from config import settings
 from models import ChatMessageCreateRequest, ChatMessageCreateResponse, ReportResponse
 
+logger = logging.getLogger(__name__)
+
+# Ответы приложения, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """Общая сессия к API приложения: соединения переиспользуются (keep-alive) между запросами"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.app_client_max_connections),
+            timeout=aiohttp.ClientTimeout(total=settings.app_client_timeout_seconds),
+            headers={"Content-Type": "application/json"},
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def _post(path: str, data: Optional[str] = None, timeout: Optional[aiohttp.ClientTimeout] = None):
+    """
+    POST в API приложения с повтором временных ошибок и экспоненциальной задержкой.
+    Повторы безопасны: прием сообщений идемпотентен по (chat_id, message_id), отчет кэшируется.
+    """
+    session = await open_session()
+    for attempt in range(1, settings.app_client_max_attempts + 1):
+        last_attempt = attempt >= settings.app_client_max_attempts
+        try:
+            async with session.post(f'{settings.app_url}{path}', data=data, timeout=timeout) as response:
+                if response.status == 200:
+                    return await response.json()
+                error = Exception(f"Error: {response.status} {await response.text()}")
+                if last_attempt or response.status not in RETRYABLE_STATUSES:
+                    raise error
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if last_attempt:
+                raise
+            error = e
+        delay = settings.app_client_retry_backoff_seconds * 2 ** (attempt - 1)
+        logger.warning(f"Request {path} failed (attempt {attempt}), retry in {delay}s: {error}")
+        await asyncio.sleep(delay)
+
 
 async def create_message(payload: ChatMessageCreateRequest) -> ChatMessageCreateResponse:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-                f'{settings.app_url}/api/messages',
-                headers={"Content-Type": "application/json"},
-                data=payload.model_dump_json(),
-        ) as response:
-            if response.status == 200:
-                json = await response.json()
-                return ChatMessageCreateResponse(**json)
-            else:
-                raise Exception(f"Error: {response.status} {await response.text()}")
+    if settings.message_batch_window_seconds > 0:
+        return await message_batcher.submit(payload)
+    return await send_message(payload)
+
+
+async def send_message(payload: ChatMessageCreateRequest) -> ChatMessageCreateResponse:
+    json = await _post('/api/messages', payload.model_dump_json())
+    return ChatMessageCreateResponse(**json)
+
+
+async def send_messages(payloads: list[ChatMessageCreateRequest]) -> list[ChatMessageCreateResponse]:
+    json = await _post('/api/messages:batch', "[" + ",".join(payload.model_dump_json() for payload in payloads) + "]")
+    return [ChatMessageCreateResponse(**item) for item in json]
+
+
+class MessageBatcher:
+    """
+    Копит сообщения, пришедшие в пределах окна (например, очередь обновлений после переподключения бота),
+    и отправляет их одним запросом POST /api/messages:batch. Каждый вызывающий получает свой ID.
+    """
+
+    def __init__(self, window_seconds: float, max_size: int):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._pending: list[tuple[ChatMessageCreateRequest, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def submit(self, payload: ChatMessageCreateRequest) -> ChatMessageCreateResponse:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window_seconds)
+        self._timer = None
+        await self._send(self._take())
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Пачка фиксируется сразу, чтобы следующие сообщения не увеличили ее сверх max_size
+        task = asyncio.create_task(self._send(self._take()))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _take(self) -> list[tuple[ChatMessageCreateRequest, asyncio.Future]]:
+        batch, self._pending = self._pending, []
+        return batch
+
+    async def _send(self, batch: list[tuple[ChatMessageCreateRequest, asyncio.Future]]):
+        if not batch:
+            return
+        try:
+            responses = await send_messages([payload for payload, _ in batch])
+            logger.info(f"Sent batch of {len(batch)} messages")
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+message_batcher = MessageBatcher(settings.message_batch_window_seconds, settings.message_batch_max_size)
 
 
 async def create_report() -> ReportResponse:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f'{settings.app_url}/api/reports') as response:
-            if response.status == 200:
-                json = await response.json()
-                return ReportResponse(**json)
-            else:
-                raise Exception(f"Error: {response.status} {await response.text()}")
+    # Отчет за день кэшируется приложением, повторный запрос не пересобирает его
+    json = await _post('/api/reports', timeout=aiohttp.ClientTimeout(total=settings.app_report_timeout_seconds))
+    return ReportResponse(**json)
@@ -15,6 +15,16 @@ class Settings(BaseSettings):
     audio_api_key: str = ""  # API ключ для OpenAI Audio API, если пусто - используем ocr_api_key
     bot_messages_path: str
     dashboard_url: str
+    # Сообщения, пришедшие в пределах окна, отправляются в приложение одним запросом; 0 - без пакетов
+    message_batch_window_seconds: float = 0.2
+    message_batch_max_size: int = 100
+    # HTTP-клиент к приложению: одна сессия на процесс с keep-alive соединениями
+    app_client_max_connections: int = 10
+    app_client_timeout_seconds: float = 30.0
+    # Сборка отчета включает Excel, загрузку и запрос к LLM
+    app_report_timeout_seconds: float = 300.0
+    app_client_max_attempts: int = 3
+    app_client_retry_backoff_seconds: float = 0.5
 
 settings = Settings()
 # Если audio_api_key не указан, используем тот же ключ, что и для OCR
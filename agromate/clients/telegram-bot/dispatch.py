@@ -224,6 +224,9 @@ async def process_message_text(message: Message, text: str) -> None:
         message_text=text,
         created_at=message.date,
     ))
+    if created_message.duplicate:
+        logger.info(f"Message from '{username}' was already stored with id: {created_message.id}")
+        return
     logger.info(f"Created message from '{username}' with id: {created_message.id}")
     await message.react([ReactionTypeEmoji(emoji="🤔")])
 
@@ -359,14 +362,15 @@ async def voice_handler(message: Message) -> None:
         # Обновляем сообщение с результатом транскрибации
         await processing_msg.edit_text(f"Распознал следующий текст:\n\n{transcribed_text}\n\nОбрабатываю...")
 
-        # Обрабатываем распознанный текст как обычное текстовое сообщение
-        await process_message_text(message, transcribed_text)
-
-        # Если есть подпись к голосовому сообщению
+        # Подпись к голосовому сообщению относится к тому же сообщению Telegram,
+        # поэтому отправляется вместе с распознанным текстом, а не отдельным сообщением
         caption = message.caption or ""
         if caption:
             logger.info(f"Voice/Audio caption: {caption}")
-            await process_message_text(message, caption)
+            transcribed_text = f"{transcribed_text}\n\n{caption}"
+
+        # Обрабатываем распознанный текст как обычное текстовое сообщение
+        await process_message_text(message, transcribed_text)
 
     except Exception as e:
         logger.error(f"Error in voice_handler: {e}", exc_info=True)
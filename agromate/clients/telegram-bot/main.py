@@ -4,6 +4,7 @@ import sys
 
 from bot import bot_client
 from api import start_api
+from app_client import open_session, close_session
 from dispatch import start_pooling
 
 logging.basicConfig(
@@ -17,10 +18,14 @@ logger = logging.getLogger(__name__)
 
 
 async def main():
-    await asyncio.gather(
-        start_pooling(bot_client),
-        start_api()
-    )
+    await open_session()
+    try:
+        await asyncio.gather(
+            start_pooling(bot_client),
+            start_api()
+        )
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
     asyncio.run(main())
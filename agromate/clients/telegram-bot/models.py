@@ -23,6 +23,8 @@ class ChatMessageCreateRequest(BaseModel):
 
 class ChatMessageCreateResponse(BaseModel):
     id: int
+    # Сообщение уже было сохранено раньше (повторная доставка)
+    duplicate: bool = False
 
 
 class ChatMessageReactionRequest(BaseModel):
@@ -37,7 +37,7 @@ check_health() {
           return 1
         fi
         ;;
-      "app" | "bot")
+      "app" | "worker" | "bot")
         # Simple check - just see if container logs have any errors
         if docker-compose logs --tail=20 "$service" | grep -i "error\|exception\|fail" > /dev/null; then
           log_message "ERROR" "${RED}Service $service has errors in logs${NC}"
@@ -92,7 +92,7 @@ check_all_health() {
   log_message "INFO" "Checking health of all services..."
   local all_healthy=true
 
-  for service in app bot db metabase; do
+  for service in app worker bot db metabase; do
     if ! check_health "$service"; then
       all_healthy=false
     fi
@@ -155,7 +155,7 @@ case "$1" in
       show_errors "$2" "$3"
     else
       log_message "INFO" "Showing errors for all services..."
-      for service in app bot db metabase; do
+      for service in app worker bot db metabase; do
         echo -e "\n${YELLOW}=== Errors for $service ===${NC}"
         show_errors "$service" "$3"
       done